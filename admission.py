@@ -0,0 +1,229 @@
+# admission.py
+"""Admission control for the routes that call the model.
+
+Each gated route has a concurrency limit and a bounded wait queue. A request
+that finds the route busy waits its turn; if the queue is full, or its
+estimated wait is past ADMISSION_MAX_WAIT, it is answered 503 with a
+Retry-After header at once instead of piling up. Waiters are admitted fairly
+per user: whoever has the fewest requests running goes first, and one user
+may only run or queue ADMISSION_PER_USER at a time (429 beyond that).
+Requests that do not say who they are from are not capped per user; client
+addresses are not used, as users behind one NAT or proxy would share a cap.
+
+Every request waiting or running in a gated route holds a server thread, so
+all gated routes together may hold at most ADMISSION_MAX_OCCUPANCY of them.
+gunicorn.conf.py sizes this to the worker's threads minus
+ADMISSION_RESERVED_THREADS (a quarter of them, at most 8). The rest keep
+cheap routes such as / and /api/chat_history responsive under load.
+"""
+import functools
+import itertools
+import math
+import os
+import threading
+import time
+
+from flask import jsonify, make_response, request
+
+import metrics
+
+ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CONCURRENCY = int(os.environ.get('ADMISSION_CONCURRENCY', 16))
+QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE', 16))
+MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', 10))
+PER_USER = int(os.environ.get('ADMISSION_PER_USER', 4))
+# None (no cap) until set_threads() learns the worker's thread count
+MAX_OCCUPANCY = int(os.environ['ADMISSION_MAX_OCCUPANCY']) if os.environ.get('ADMISSION_MAX_OCCUPANCY') else None
+# Urlencoded and JSON bodies up to this size are read early to find their user_id
+PEEK_BYTES = 64 * 1024
+BUSY_MESSAGE = 'The server is busy, please try again shortly'
+
+# Shared by all gates, which also share the worker-wide occupancy cap
+_cond = threading.Condition()
+_occupied = 0
+_seq = itertools.count()
+
+
+class Overloaded(Exception):
+    """A request was turned away before it started; answered with `status` and Retry-After."""
+
+    def __init__(self, message, reason, retry_after=1, status=503):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class Gate:
+    """Concurrency limit for one route, with a bounded wait queue served fairly per user."""
+
+    def __init__(self, name, limit, queue_size, max_wait, per_user):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.per_user = per_user
+        self.active = 0
+        self._waiters = []
+        self._user_active = {}
+        self._user_waiting = {}
+        # Moving average of how long an admitted request holds its slot
+        self._service_seconds = 1.0
+
+    def _next(self):
+        """The waiter to admit now, if any: fewest running requests for its user, then FIFO."""
+        if self.active >= self.limit:
+            return None
+        eligible = [w for w in self._waiters if self._user_active.get(w[1], 0) < self.per_user]
+        return min(eligible, key=lambda w: (self._user_active.get(w[1], 0), w[0]), default=None)
+
+    def _estimate(self, position):
+        return math.ceil(position / self.limit) * self._service_seconds
+
+    def _adjust(self, counts, user, amount):
+        counts[user] = counts.get(user, 0) + amount
+        if not counts[user]:
+            del counts[user]
+
+    def enter(self, user):
+        """Wait for a slot; raises Overloaded when the request should be turned away."""
+        global _occupied
+        deadline = time.monotonic() + self.max_wait
+        with _cond:
+            held = self._user_active.get(user, 0) + self._user_waiting.get(user, 0)
+            if held >= self.per_user:
+                raise Overloaded('Too many concurrent requests for this user', 'user',
+                                 retry_after=self._service_seconds, status=429)
+            if MAX_OCCUPANCY is not None and _occupied >= MAX_OCCUPANCY:
+                raise Overloaded('Server at capacity', 'capacity',
+                                 retry_after=self._estimate(len(self._waiters) + 1))
+            entry = (next(_seq), user)
+            self._waiters.append(entry)
+            if self._next() is not entry:
+                position = len(self._waiters)
+                if position > self.queue_size:
+                    self._waiters.remove(entry)
+                    raise Overloaded('Wait queue full', 'queue_full', retry_after=self._estimate(position))
+                if self._estimate(position) > self.max_wait:
+                    self._waiters.remove(entry)
+                    raise Overloaded('Estimated wait past the deadline', 'deadline',
+                                     retry_after=self._estimate(position))
+            _occupied += 1
+            self._adjust(self._user_waiting, user, 1)
+            try:
+                while self._next() is not entry:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Overloaded('Waited past the deadline', 'deadline',
+                                         retry_after=self._estimate(len(self._waiters)))
+                    _cond.wait(remaining)
+            except BaseException:
+                _occupied -= 1
+                _cond.notify_all()
+                raise
+            finally:
+                self._waiters.remove(entry)
+                self._adjust(self._user_waiting, user, -1)
+            self.active += 1
+            self._adjust(self._user_active, user, 1)
+        return time.monotonic()
+
+    def leave(self, user, admitted_at):
+        global _occupied
+        with _cond:
+            self.active -= 1
+            self._adjust(self._user_active, user, -1)
+            _occupied -= 1
+            self._service_seconds += 0.1 * (time.monotonic() - admitted_at - self._service_seconds)
+            _cond.notify_all()
+
+    def stats(self):
+        with _cond:
+            return {
+                'active': self.active,
+                'waiting': len(self._waiters),
+                'limit': self.limit,
+                'service_seconds': self._service_seconds,
+            }
+
+
+def set_threads(threads):
+    """Cap occupancy for a worker serving `threads` requests at once, unless
+    ADMISSION_MAX_OCCUPANCY sets it directly."""
+    global MAX_OCCUPANCY
+    if os.environ.get('ADMISSION_MAX_OCCUPANCY'):
+        return
+    reserved = int(os.environ.get('ADMISSION_RESERVED_THREADS', min(8, threads // 4)))
+    MAX_OCCUPANCY = max(1, threads - reserved)
+
+
+def occupancy():
+    with _cond:
+        return {'occupied': _occupied, 'max_occupancy': MAX_OCCUPANCY or 0}
+
+
+metrics.register_stats('admission', occupancy)
+
+
+def user_key():
+    """Who a request is from: the X-User-ID header, else a user_id query parameter,
+    or one in a small urlencoded or JSON body. Anonymous requests get a key of their own.
+
+    Only bodies of a known length up to PEEK_BYTES are read; multipart and raw
+    uploads are never parsed before admission, so they must name their user
+    in the header or query string.
+    """
+    user = request.headers.get('X-User-ID') or request.args.get('user_id')
+    if not user and request.content_length is not None and request.content_length <= PEEK_BYTES:
+        if request.mimetype == 'application/x-www-form-urlencoded':
+            user = request.form.get('user_id')
+        elif request.is_json:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                user = data.get('user_id')
+    if user:
+        return f'user:{user}'
+    return f'anonymous:{next(_seq)}'
+
+
+def limit(route, concurrency=None):
+    """Gate a view: at most `concurrency` requests run at once, ADMISSION_QUEUE more wait.
+
+    Per-route overrides: ADMISSION_CONCURRENCY_<ROUTE>, e.g. ADMISSION_CONCURRENCY_CHATBREED.
+    A streamed response holds its slot until the stream is closed.
+    """
+    gate = Gate(
+        route,
+        int(os.environ.get(f'ADMISSION_CONCURRENCY_{route.upper()}', concurrency or CONCURRENCY)),
+        QUEUE_SIZE, MAX_WAIT, PER_USER,
+    )
+    metrics.register_stats('admission_route', gate.stats, route=route)
+
+    def decorator(view):
+        if not ENABLED:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            user = user_key()
+            try:
+                with metrics.timer('admission'):
+                    admitted_at = gate.enter(user)
+            except Overloaded as e:
+                metrics.incr('admission_rejected_total', route=route, reason=e.reason)
+                return jsonify({'error': BUSY_MESSAGE}), e.status, {'Retry-After': str(e.retry_after)}
+            metrics.incr('admission_admitted_total', route=route)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                gate.leave(user, admitted_at)
+                raise
+            if response.is_streamed:
+                response.call_on_close(lambda: gate.leave(user, admitted_at))
+            else:
+                gate.leave(user, admitted_at)
+            return response
+
+        return wrapper
+
+    return decorator
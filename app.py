@@ -1,97 +1,117 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import os
-import google.generativeai as generative_ai
-import base64
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from context_cache import ContextCache
 from cow_breed_api import cow_breed_bp
+from image_pipeline import ImageError, image_cache, image_cache_key, prepare_image
+import admission
+import breeds
+import generation
+import logs
+import metrics
+from logs import log
+from model_registry import get_model
+from prompts import (IMAGE_PROMPT_PREFIXES, IMAGE_SYSTEM_PROMPT, TEXT_PROMPT_PREFIX, TEXT_SYSTEM_PROMPT,
+                     language_name, localize)
+from response_cache import create_response_cache, make_key, normalize_prompt
+from scheduler import BATCH, INTERACTIVE, UpstreamUnavailable, scheduler
+from streaming import iter_text, stream_json, stream_requested, stream_text
+from uploads import (MAX_UPLOAD_BYTES, UPLOADED_IMAGE, decode_base64_image, read_image_batch_request,
+                     read_image_request, reject_oversize_request)
 
 load_dotenv()
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+logs.init_app(app)
+app.before_request(reject_oversize_request)
 app.register_blueprint(cow_breed_bp)
 
-generative_ai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
-# print( "Google Generative AI API Key:", os.environ.get("GOOGLE_API_KEY"))
-system_prompt_text_model = """
-	You are an expert on Indian indigenous cow breeds (desi cows). Your role is to provide accurate,
-	educational information that:
-	- Raises awareness about the unique qualities and benefits of Indian cow breeds
-	- Explains scientific aspects of indigenous breeding programs
-	- Discusses the nutritional benefits of A2 milk from Indian cows
-	- Provides detailed data on Indian cow breeds, their characteristics, and ideal breeding conditions, helping farmers choose the best breed based on their location and needs
-	- Outlines the environmental sustainability of traditional cattle rearing
-	- Aligns with the principles of the Kamdhenu Program for cow conservation
-    - provide its bread information, genetic information and  ideal breeding conditions
-	- Limit your response strictly to a maximum of 120 tokens.
-	Only provide information related to Indian cows and their benefits. If asked about unrelated topics,
-	gently redirect the conversation to relevant aspects of Indian cow conservation and promotion.
-	"""
-system_prompt_image = """
-You are an expert on Indian indigenous cow breeds (desi cows) with knowledge in veterinary observation. Your role is to:
-
- When analyzing cow images:
-   - Describe any visible skin abnormalities, lesions, or other potential signs of disease in a concise manner
-   - Based on visible symptoms, suggest 2-3 possible conditions that *might* be indicated, emphasizing these are just possibilities, not diagnoses
-   - Provide general information about each suggested condition, including common symptoms, transmission methods (if known), and potential impacts on the cow's health and productivity
-   - State clearly that this is NOT a veterinary diagnosis and that the user MUST consult a veterinarian for proper diagnosis and treatment
-   - If the image appears relatively normal, state that as well, but still recommend regular veterinary checkups
-   - Do not provide treatment recommendations - focus only on observation and information
-   - Limit your response strictly to a maximum of 250 tokens.
-   - You are a multilingual image analysis expert. Respond only in the language requested.
-   - Do not include English unless explicitly asked. Focus on clarity and use medical terminology as needed.
-Only provide information related to Indian cows and their health/benefits. If asked about unrelated topics,
-gently redirect the conversation to relevant aspects of Indian cow conservation, health, and promotion.
-
-"""
+# The SDK is configured on first use (model_registry.genai), from GOOGLE_API_KEY
+IMAGE_MODEL = "gemini-2.0-flash-exp"
+DEFAULT_IMAGE_PROMPT = 'Analyze this cow image based on the criteria provided in your instructions.'
+IMAGE_GENERATION_CONFIG = {
+    "temperature": 0.7,
+}
+TEXT_MODEL = "gemini-2.0-flash-exp"
+TEXT_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "max_output_tokens": 250
+}
+# Server-side cached system prompts; sent inline when CONTEXT_CACHE_ENABLED is off or caching fails
+image_context = ContextCache('image', IMAGE_MODEL, IMAGE_SYSTEM_PROMPT, IMAGE_GENERATION_CONFIG)
+text_context = ContextCache('text', TEXT_MODEL, TEXT_SYSTEM_PROMPT, TEXT_GENERATION_CONFIG)
+# Opt-in via TEXT_CACHE_ENABLED; None when disabled
+text_cache = create_response_cache('TEXT')
+UPSTREAM_BUSY_MESSAGE = 'The AI service is busy, please try again shortly'
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 50))
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 8))
+
 @app.route('/', methods=['GET'])
 def home():
 	return jsonify({'message': 'Welcome to the Generative AI API!'}), 200
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'Request body exceeds {MAX_UPLOAD_BYTES} bytes'}), 413
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'text': text_cache.stats() if text_cache is not None else None,
+        'image': image_cache.stats() if image_cache is not None else None,
+    }), 200
+
+@app.route('/scheduler_stats', methods=['GET'])
+def scheduler_stats():
+    return jsonify(scheduler.stats()), 200
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/image_to_text', methods=['POST'])
+@admission.limit('image_to_text')
 def image_to_text():
+    language = 'en'
     try:
-        data = request.get_json()
-        image_base64 = data.get('image_base64')
-        prompt = data.get('prompt', 'Analyze this cow image based on the criteria provided in your instructions.')
+        # JSON with base64, multipart/form-data, or the raw image as the body
+        try:
+            data, image_bytes = read_image_request('image_base64')
+        except ImageError:
+            return jsonify({'error': 'Invalid image'}), 400
+        prompt = data.get('prompt', DEFAULT_IMAGE_PROMPT)
         language = data.get('language', 'en')
 
-        if not image_base64:
-            return jsonify({'error': 'Image (base64 encoded) is required'}), 400
+        if not image_bytes:
+            return jsonify({'error': 'Image is required (base64 encoded in JSON, or as a multipart/binary upload)'}), 400
 
-        image_bytes = base64.b64decode(image_base64)
+        # Decode, orient and downscale once; the model gets a compact JPEG
+        try:
+            image = prepare_image(image_bytes)
+        except ImageError:
+            return jsonify({'error': 'Invalid image'}), 400
 
+        image_model, contents, cache_key = image_analysis_request(image, prompt, language)
 
-        localized_prompt = get_localized_prompt(language, prompt)
+        if stream_requested(data):
+            cached = image_cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                return stream_text([cached])
+            response = run_image_model(generation.stream, image_model, contents)
 
-        IMAGE_MODEL = "gemini-2.0-flash-exp"
-        image_model = generative_ai.GenerativeModel(IMAGE_MODEL)
+            # Only a complete, usable answer is cached; otherwise the stream ends with an error
+            def on_complete(text):
+                generation.finish(response, 'image_to_text')
+                if cache_key is not None:
+                    image_cache.set(cache_key, text)
 
-        response = image_model.generate_content(
-            contents=[
-                {"text": system_prompt_image},
-                {"inline_data": {"mime_type": "image/jpeg", "data": image_base64}},
-                {"text": localized_prompt},
-            ],
-            generation_config={
-                "temperature": 0.7,
+            return stream_text(iter_text(response), on_complete=on_complete,
+                               error_message="An error occurred during image to text conversion")
 
-            }
-        )
-
-        generated_text = ""
-
-        if response and hasattr(response, "candidates") and response.candidates:
-            for candidate in response.candidates:
-                if hasattr(candidate, "content") and hasattr(candidate.content, "parts"):
-                    for part in candidate.content.parts:
-                        if hasattr(part, "text"):
-                            generated_text += part.text
-        elif isinstance(response, dict) and "candidates" in response and response["candidates"]:
-            for candidate in response["candidates"]:
-                if "content" in candidate and "parts" in candidate["content"]:
-                    for part in candidate["content"]["parts"]:
-                        if "text" in part:
-                            generated_text += part["text"]
+        generated_text = analyze_image(image_model, contents, cache_key)
 
-        else:
+        if generated_text is None:
 
             error_messages = {
                 'en': "Error: Could not extract text from the model response.",
@@ -100,12 +120,13 @@ def image_to_text():
             }
             generated_text = error_messages.get(language, error_messages['en'])
 
-        # print(f"Generated text in {language}: {generated_text}")
         return jsonify({'result': generated_text}), 200
 
-    except Exception as e:
-        print(f"Error (image_to_text): {e}")
-
+    except UpstreamUnavailable as e:
+        log.warning('image_to_text upstream unavailable', extra={'fields': {'error': str(e)}})
+        return jsonify({'error': UPSTREAM_BUSY_MESSAGE}), 503, {'Retry-After': str(e.retry_after)}
+    except Exception:
+        log.exception('image_to_text failed')
 
         error_messages = {
             'en': "An error occurred during image to text conversion",
@@ -116,118 +137,217 @@ def image_to_text():
         error_msg = error_messages.get(language, error_messages['en'])
         return jsonify({'error': error_msg}), 500
 
+def analyze_batch_item(index, item, defaults):
+    result = {'index': index, 'id': item.get('id', index)}
+    try:
+        image_bytes = item.get(UPLOADED_IMAGE) or decode_base64_image(item.get('image_base64') or item.get('image'))
+        if not image_bytes:
+            return {**result, 'error': 'Image is required'}
+        image = prepare_image(image_bytes)
+        prompt = item.get('prompt', defaults.get('prompt', DEFAULT_IMAGE_PROMPT))
+        language = item.get('language', defaults.get('language', 'en'))
+        generated_text = analyze_image(*image_analysis_request(image, prompt, language), priority=BATCH)
+        if generated_text is None:
+            return {**result, 'error': 'Could not extract text from the model response'}
+        return {**result, 'result': generated_text}
+    except ImageError:
+        return {**result, 'error': 'Invalid image'}
+    except UpstreamUnavailable as e:
+        log.warning('image_to_text_batch item upstream unavailable',
+                    extra={'fields': {'index': index, 'error': str(e)}})
+        return {**result, 'error': UPSTREAM_BUSY_MESSAGE, 'retry_after': e.retry_after}
+    except Exception:
+        log.exception('image_to_text_batch item failed', extra={'fields': {'index': index}})
+        return {**result, 'error': 'An error occurred during image to text conversion'}
+
+@app.route('/image_to_text/batch', methods=['POST'])
+# Each batch already fans out to BATCH_MAX_CONCURRENCY model calls
+@admission.limit('image_to_text_batch', concurrency=2)
+def image_to_text_batch():
+    try:
+        data, items = read_image_batch_request('image_base64')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not items:
+        return jsonify({'error': 'At least one image is required'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'A batch can hold at most {BATCH_MAX_ITEMS} images'}), 400
+    try:
+        concurrency = max(1, min(int(data.get('concurrency', BATCH_MAX_CONCURRENCY)), BATCH_MAX_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'concurrency must be an integer'}), 400
+
+    # One line per image, in completion order, then a summary line
+    def results():
+        succeeded = failed = 0
+        pool = ThreadPoolExecutor(max_workers=min(concurrency, len(items)))
+        try:
+            futures = [pool.submit(analyze_batch_item, index, item, data) for index, item in enumerate(items)]
+            for future in as_completed(futures):
+                result = future.result()
+                if 'error' in result:
+                    failed += 1
+                else:
+                    succeeded += 1
+                yield result
+        finally:
+            # Client went away: don't start the remaining items
+            pool.shutdown(wait=False, cancel_futures=True)
+        yield {'done': True, 'succeeded': succeeded, 'failed': failed}
+
+    return stream_json(results())
+
+def image_analysis_request(image, prompt, language):
+    """Model, contents (without the system prompt) and cache key (None when caching is off)
+    for analyzing a prepared image."""
+    localized_prompt = get_localized_prompt(language, prompt)
+
+    image_model = get_model(IMAGE_MODEL, generation_config=IMAGE_GENERATION_CONFIG)
+
+    contents = [
+        image.as_part(),
+        {"text": localized_prompt},
+    ]
+
+    # Re-uploads of the same photo with the same prompt/language skip the model
+    cache_key = None
+    if image_cache is not None:
+        cache_key = image_cache_key(image, 'image_to_text', localized_prompt,
+                                    IMAGE_MODEL, IMAGE_GENERATION_CONFIG, IMAGE_SYSTEM_PROMPT)
+    return image_model, contents, cache_key
+
+def analyze_image(image_model, contents, cache_key, priority=INTERACTIVE):
+    if cache_key is None:
+        return generate_image_text(image_model, contents, priority)
+    generated_text, _ = image_cache.get_or_compute(
+        cache_key, lambda: generate_image_text(image_model, contents, priority))
+    return generated_text
+
+def generate_image_text(image_model, contents, priority=INTERACTIVE):
+    def call(fn, contents):
+        return generation.generate(fn, contents, 'image_to_text', priority)
+    return run_image_model(call, image_model, contents).text
+
+def run_image_model(call, image_model, contents):
+    """call(generate_content, contents) against the cached system prompt, or with it inline."""
+    return image_context.run(
+        lambda model: call(model.generate_content, contents),
+        lambda: call(image_model.generate_content, [{"text": IMAGE_SYSTEM_PROMPT}, *contents]))
+
 def get_localized_prompt(language_code, prompt):
-    localized_templates = {
-        'hi': f"कृपया इस छवि का विश्लेषण करें और अपनी प्रतिक्रिया हिंदी में दें। {prompt}",
-        'bn': f"এই ছবিটি বিশ্লেষণ করুন এবং বাংলায় উত্তর দিন। {prompt}",
-        'gu': f"કૃપા કરીને આ છબીને વિશ્લેષણ કરો અને ગુજરાતીમાં જવાબ આપો. {prompt}",
-        'mr': f"कृपया या चित्राचे विश्लेषण करा आणि मराठीत उत्तर द्या. {prompt}",
-        'ta': f"இந்த படத்தை பகுப்பாய்வு செய்து தமிழில் பதிலளிக்கவும். {prompt}",
-        'te': f"ఈ చిత్రాన్ని విశ్లేషించి తెలుగులో స్పందించండి. {prompt}",
-        'kn': f"ದಯವಿಟ್ಟು ಈ ಚಿತ್ರವನ್ನು ವಿಶ್ಲೇಷಿಸಿ ಮತ್ತು ಕನ್ನಡದಲ್ಲಿ ಪ್ರತಿಕ್ರಿಯೆ ನೀಡಿರಿ. {prompt}",
-        'ml': f"ഈ ചിത്രം വിശകലനം ചെയ്ത് മലയാളത്തിൽ പ്രതികരിക്കൂ. {prompt}",
-        'pa': f"ਕਿਰਪਾ ਕਰਕੇ ਇਸ ਚਿੱਤਰ ਦਾ ਵਿਸ਼ਲੇਸ਼ਣ ਕਰੋ ਅਤੇ ਪੰਜਾਬੀ ਵਿੱਚ ਜਵਾਬ ਦਿਓ। {prompt}",
-        'or': f"ଦୟାକରି ଏହି ଛବିକୁ ବିଶ୍ଲେଷଣ କରନ୍ତୁ ଏବଂ ଓଡ଼ିଆରେ ପ୍ରତିକ୍ରିୟା ଦିଅ। {prompt}",
-        'en': f"Please analyze this image and respond in English. {prompt}",
-    }
-
-    return localized_templates.get(language_code, f"Please analyze this image and respond in English. {prompt}")
+    return localize(IMAGE_PROMPT_PREFIXES, language_code, prompt)
 
 def get_language_name(language_code):
-    language_names = {
-        'en': 'English',
-        'hi': 'Hindi',
-        'bn': 'Bengali',
-        'gu': 'Gujarati',
-        'mr': 'Marathi',
-        'ta': 'Tamil',
-        'te': 'Telugu',
-        'kn': 'Kannada',
-        'ml': 'Malayalam',
-        'pa': 'Punjabi',
-        'or': 'Odia',
-
-    }
-    return language_names.get(language_code, 'English')
+    return language_name(language_code)
+
+def generate_text(text_model, prompt):
+    def call(fn, contents):
+        return generation.generate(fn, contents, 'text_to_text')
+    return run_text_model(call, text_model, prompt).text
+
+def run_text_model(call, text_model, prompt):
+    """call(generate_content, contents) against the cached system prompt, or with it inline."""
+    return text_context.run(
+        lambda model: call(model.generate_content, [{'text': questionWithFacts(prompt)}]),
+        lambda: call(text_model.generate_content, [{'text': promptToTextModel(prompt)}]))
+
 @app.route('/text_to_text', methods=['POST'])
+@admission.limit('text_to_text')
 def text_to_text():
 
     try:
-        data = request.get_json()
+        with metrics.timer('parse'):
+            data = request.get_json()
         prompt = data.get('prompt')
 
         # if not prompt:
         #     return jsonify({'error': 'Prompt is required'}), 400
 
-        TEXT_MODEL = "gemini-2.0-flash-exp"
-        text_model = generative_ai.GenerativeModel(TEXT_MODEL)
-
-        response = text_model.generate_content(
-            # contents=promptToTextModel(prompt),
-            contents=[{'text': promptToTextModel(prompt)}],
-            generation_config={
-       		 "temperature": 0.7,
-        	 "max_output_tokens": 250
-    		}
-
-            # temperature=data.get('temperature', 0.7),
-            # max_output_tokens=data.get('max_output_tokens', 512)
-        )
-
-        generated_text = ""
-
-
-        if response and hasattr(response, "candidates") and response.candidates:
-            for candidate in response.candidates:
-                if hasattr(candidate, "content") and hasattr(candidate.content, "parts"):
-                    for part in candidate.content.parts:
-                        if hasattr(part, "text"):
-                            generated_text += part.text
-        elif isinstance(response, dict) and "candidates" in response and response["candidates"]:
-            for candidate in response["candidates"]:
-                if "content" in candidate and "parts" in candidate["content"]:
-                    for part in candidate["content"]["parts"]:
-                        if "text" in part:
-                            generated_text += part["text"]
+        language = data.get('language', 'en')
 
-        # Improved Error handling
+        # Single-fact breed questions are answered from the local index
+        answer = breeds.lookup(prompt) if language == 'en' else None
+        if answer is not None:
+            metrics.incr('breed_direct_answers_total')
+            if stream_requested(data):
+                return stream_text([answer])
+            return jsonify({'result': answer}), 200
+
+        text_model = get_model(TEXT_MODEL, generation_config=TEXT_GENERATION_CONFIG)
+
+        def generate():
+            return generate_text(text_model, prompt)
+
+        if text_cache is not None:
+            cache_key = make_key('text_to_text', normalize_prompt(prompt), language,
+                                 TEXT_MODEL, TEXT_GENERATION_CONFIG, TEXT_SYSTEM_PROMPT)
+
+        if stream_requested(data):
+            cached = text_cache.get(cache_key) if text_cache is not None else None
+            if cached is not None:
+                return stream_text([cached])
+            response = run_text_model(generation.stream, text_model, prompt)
+
+            # Only a complete, usable answer is cached; otherwise the stream ends with an error
+            def on_complete(text):
+                generation.finish(response, 'text_to_text')
+                if text_cache is not None:
+                    text_cache.set(cache_key, text)
+
+            return stream_text(iter_text(response), on_complete=on_complete)
+
+        if text_cache is not None:
+            generated_text, _ = text_cache.get_or_compute(cache_key, generate)
         else:
+            generated_text = generate()
+
+        # Improved Error handling
+        if generated_text is None:
             generated_text = "Error: Could not extract text from the model response."  # Or log the error
 
-        print(generated_text)  # Print the extracted text (for debugging)
         return jsonify({'result': generated_text}), 200
-    except Exception as e:
-        print(f"Error (text_to_text): {e}")
+    except UpstreamUnavailable as e:
+        log.warning('text_to_text upstream unavailable', extra={'fields': {'error': str(e)}})
+        return jsonify({'error': UPSTREAM_BUSY_MESSAGE}), 503, {'Retry-After': str(e.retry_after)}
+    except Exception:
+        log.exception('text_to_text failed')
         return jsonify({'error': 'An error occurred during text generation'}), 500
 
 
 @app.route('/text_to_text_chat', methods=['POST'])
+@admission.limit('text_to_text_chat')
 def text_to_text_chat():
     try:
-        data = request.get_json()
+        with metrics.timer('parse'):
+            data = request.get_json()
         prompt = data.get('prompt')
 
-        # Initialize chat with system instructions
-        TEXT_MODEL = "gemini-2.0-flash-exp"  # Choose the best chat-capable model
-        model=generative_ai.GenerativeModel(TEXT_MODEL)
-        chat = model.start_chat(history=[])
-
+        # No history is kept between requests, so this is a single call with the
+        # text model's system instructions
+        model = get_model(TEXT_MODEL, system_instruction=TEXT_SYSTEM_PROMPT,
+                          generation_config=TEXT_GENERATION_CONFIG)
+        generated_text = text_context.run(
+            lambda cached_model: generation.generate(cached_model.generate_content, prompt, 'text_to_text_chat'),
+            lambda: generation.generate(model.generate_content, prompt, 'text_to_text_chat')).text
 
-        chat = chat.send_message(prompt)
+        if generated_text is None:
+            generated_text = "Error: Could not extract text from the model response."
 
-        # Generate response from the chat model
-        response = chat.send_message(prompt)
-
-        generated_text = response['message']['content']
-
-        print(generated_text)  # Debugging output
         return jsonify({'result': generated_text}), 200
 
-    except Exception as e:
-        print(f"Error (text_to_text): {e}")
+    except UpstreamUnavailable as e:
+        log.warning('text_to_text_chat upstream unavailable', extra={'fields': {'error': str(e)}})
+        return jsonify({'error': UPSTREAM_BUSY_MESSAGE}), 503, {'Retry-After': str(e.retry_after)}
+    except Exception:
+        log.exception('text_to_text_chat failed')
         return jsonify({'error': 'An error occurred during text generation'}), 500
 
 def promptToTextModel(userPromt):
-	return f"{system_prompt_text_model}\n\nUser: {userPromt}"
+	return f"{TEXT_PROMPT_PREFIX}{questionWithFacts(userPromt)}"
+
+def questionWithFacts(userPromt):
+	# Facts on any breed the question names are appended from the local index
+	return f"{userPromt}{breeds.grounding(userPromt)}"
 if __name__ == '__main__':
+  # Development server only; use `gunicorn -c gunicorn.conf.py app:app` in production
   app.run(port=5000, host='0.0.0.0',debug=True)
@@ -0,0 +1,205 @@
+# batch_analyze.py
+"""Analyze archived cow photos offline, without going through the HTTP API.
+
+    python batch_analyze.py photos/ -o results.jsonl --workers 8 --rate 120
+    python batch_analyze.py manifest.csv -o results.csv --mode breed --language hi
+
+Inputs are image directories (walked recursively) or manifest files:
+.txt (one path per line), .csv (a `path` column, optional `id`, `language`,
+`prompt`) or .jsonl (objects with the same keys). Results are appended to
+the output as they finish, so an interrupted run can simply be restarted:
+images already recorded as "ok" with the same mode, language and prompt are
+skipped, failed ones are retried.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import app as api  # noqa: E402
+import cow_breed_api  # noqa: E402
+from image_pipeline import prepare_image  # noqa: E402
+from generation import generate  # noqa: E402
+from scheduler import BATCH, scheduler  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+DEFAULT_BREED_PROMPT = 'Identify the breed of this cow and note its condition.'
+FIELDS = ['path', 'id', 'mode', 'language', 'prompt', 'status', 'result', 'error', 'elapsed_ms']
+
+
+def iter_manifest(path):
+    ext = os.path.splitext(path)[1].lower()
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='', encoding='utf-8') as f:
+        if ext == '.csv':
+            rows = csv.DictReader(f)
+        elif ext in ('.jsonl', '.ndjson'):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = ({'path': line.strip()} for line in f if line.strip() and not line.startswith('#'))
+        for row in rows:
+            row = {k: v for k, v in row.items() if v not in (None, '')}
+            row['path'] = os.path.join(base, row['path'])
+            yield row
+
+
+def iter_jobs(inputs):
+    for source in inputs:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield {'path': os.path.join(root, name)}
+        else:
+            yield from iter_manifest(source)
+
+
+def checkpoint_key(path, mode, language, prompt):
+    # No prompt (the mode's default) is recorded as null in JSONL and '' in CSV
+    return path, mode, language, prompt or ''
+
+
+def load_checkpoint(output):
+    """(path, mode, language, prompt) of the images analyzed successfully in a previous run."""
+    if not os.path.exists(output):
+        return set()
+    with open(output, newline='', encoding='utf-8') as f:
+        if output.endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        return {checkpoint_key(row['path'], row.get('mode'), row.get('language'), row.get('prompt'))
+                for row in rows if row.get('status') == 'ok'}
+
+
+def job_key(job, args):
+    return checkpoint_key(job['path'], args.mode, job.get('language', args.language), job.get('prompt', args.prompt))
+
+
+class ResultWriter:
+    def __init__(self, output):
+        new_file = not os.path.exists(output) or os.path.getsize(output) == 0
+        self.file = open(output, 'a', newline='', encoding='utf-8')
+        self.csv = None
+        if output.endswith('.csv'):
+            fieldnames = FIELDS
+            if not new_file:
+                # Keep the columns of a file written by an earlier version
+                with open(output, newline='', encoding='utf-8') as f:
+                    fieldnames = next(csv.reader(f))
+            self.csv = csv.DictWriter(self.file, fieldnames=fieldnames, extrasaction='ignore')
+            if new_file:
+                self.csv.writeheader()
+
+    def write(self, record):
+        if self.csv is not None:
+            self.csv.writerow(record)
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        # Flush every record so the output doubles as the checkpoint
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def analyze_health(image, prompt, language):
+    return api.analyze_image(*api.image_analysis_request(image, prompt or api.DEFAULT_IMAGE_PROMPT, language),
+                             priority=BATCH)
+
+
+def analyze_breed(image, prompt, language):
+    content = [cow_breed_api.get_localized_prompt(language, prompt or DEFAULT_BREED_PROMPT), image.as_part()]
+    return cow_breed_api.breed_context.run(
+        lambda model: generate(model.generate_content, content, 'batch_breed', priority=BATCH),
+        lambda: generate(cow_breed_api.breed_model().generate_content, content, 'batch_breed', priority=BATCH)).text
+
+
+ANALYZERS = {'health': analyze_health, 'breed': analyze_breed}
+
+
+def run_job(job, args):
+    language = job.get('language', args.language)
+    record = {
+        'path': job['path'],
+        'id': job.get('id', os.path.splitext(os.path.basename(job['path']))[0]),
+        'mode': args.mode,
+        'language': language,
+        'prompt': job.get('prompt', args.prompt),
+    }
+    start = time.perf_counter()
+    try:
+        with open(job['path'], 'rb') as f:
+            image = prepare_image(f.read())
+        # Rate limiting and retries/backoff happen in the shared scheduler
+        result = ANALYZERS[args.mode](image, job.get('prompt', args.prompt), language)
+        if result is None:
+            raise RuntimeError('Could not extract text from the model response')
+        record.update(status='ok', result=result)
+    except Exception as e:
+        record.update(status='error', error=f"{type(e).__name__}: {e}")
+    record['elapsed_ms'] = round((time.perf_counter() - start) * 1000)
+    return record
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='image directories and/or manifest files')
+    parser.add_argument('-o', '--output', default='results.jsonl', help='.jsonl or .csv results file (default: %(default)s)')
+    parser.add_argument('--mode', choices=sorted(ANALYZERS), default='health',
+                        help='health: /image_to_text analysis; breed: /api/chatBreed breed expert (default: %(default)s)')
+    parser.add_argument('--language', default='en', help='default response language (default: %(default)s)')
+    parser.add_argument('--prompt', help='default prompt for images without one')
+    parser.add_argument('--workers', type=int, default=8, help='parallel model calls (default: %(default)s)')
+    parser.add_argument('--rate', type=float, default=60, help='max model calls per minute, 0 for no limit (default: %(default)s)')
+    parser.add_argument('--limit', type=int, help='stop after this many images')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    done = load_checkpoint(args.output)
+    found = list(iter_jobs(args.inputs))
+    jobs = [job for job in found if job_key(job, args) not in done]
+    skipped = len(found) - len(jobs)
+    if args.limit is not None:
+        jobs = jobs[:args.limit]
+    print(f"{len(jobs)} images to analyze ({skipped} already done)", file=sys.stderr)
+
+    scheduler.set_rate(args.rate)
+    writer = ResultWriter(args.output)
+    counts = {'ok': 0, 'error': 0}
+    started = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        futures = [pool.submit(run_job, job, args) for job in jobs]
+        for finished, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            writer.write(record)
+            counts[record['status']] += 1
+            if record['status'] == 'error':
+                print(f"error: {record['path']}: {record['error']}", file=sys.stderr)
+            if finished % 25 == 0 or finished == len(futures):
+                rate = finished / max(time.monotonic() - started, 1e-9) * 60
+                print(f"{finished}/{len(futures)} done, {rate:.0f}/min", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume", file=sys.stderr)
+        return 130
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        writer.close()
+
+    print(f"ok: {counts['ok']}, errors: {counts['error']}", file=sys.stderr)
+    return 1 if counts['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+# bench/fake_app.py
+"""app.py served against the fake Gemini backend:
+
+    gunicorn -c gunicorn.conf.py bench.fake_app:app
+
+The fake is installed when the SDK is first configured, so startup stays as
+lazy as the real app's.
+"""
+import model_registry
+
+_configure = model_registry.configure
+
+
+def configure(sdk):
+    _configure(sdk)
+    from bench import fake_genai
+    fake_genai.install()
+
+
+model_registry.configure = configure
+
+from app import app  # noqa: E402,F401
@@ -0,0 +1,208 @@
+# bench/fake_genai.py
+"""Local stand-in for the Gemini API, so benchmarks never call the paid service.
+
+install() replaces the SDK's default generative and cache clients with FakeClient
+and FakeCacheClient. Requests still go through the real google.generativeai code (request building, chat
+history, response parsing, streaming); only the network round-trip is
+simulated, with a sleep that releases the GIL like real I/O.
+
+Tuned with environment variables (defaults in brackets):
+  FAKE_LATENCY_MS [800]       time to a complete response
+  FAKE_JITTER_MS [200]        uniform +/- jitter on every delay
+  FAKE_FIRST_CHUNK_MS [300]   time to the first chunk of a streamed response
+  FAKE_STREAM_CHUNKS [8]      chunks per streamed response
+  FAKE_RESPONSE_WORDS [90]    length of each answer
+  FAKE_ERROR_RATE [0]         fraction of calls failing with 503 or 429
+  FAKE_PROMPT_MS_PER_1K [40]  prompt processing time per 1000 uncached prompt tokens
+  FAKE_CACHE_MIN_TOKENS [4096] smallest cacheable content, as Gemini enforces it; the
+                              app's system prompts are below it, so set 0 to exercise caching
+"""
+import datetime
+import os
+import random
+import threading
+import time
+
+from google.api_core import exceptions
+from google.generativeai import caching, client, protos
+
+LATENCY = float(os.environ.get('FAKE_LATENCY_MS', 800)) / 1000
+JITTER = float(os.environ.get('FAKE_JITTER_MS', 200)) / 1000
+FIRST_CHUNK = float(os.environ.get('FAKE_FIRST_CHUNK_MS', 300)) / 1000
+STREAM_CHUNKS = int(os.environ.get('FAKE_STREAM_CHUNKS', 8))
+RESPONSE_WORDS = int(os.environ.get('FAKE_RESPONSE_WORDS', 90))
+ERROR_RATE = float(os.environ.get('FAKE_ERROR_RATE', 0))
+PROMPT_SECONDS_PER_TOKEN = float(os.environ.get('FAKE_PROMPT_MS_PER_1K', 40)) / 1000 / 1000
+CACHE_MIN_TOKENS = int(os.environ.get('FAKE_CACHE_MIN_TOKENS', 4096))
+
+# Gemini bills a fixed number of tokens per image, and about 4 characters per text token
+IMAGE_TOKENS = 258
+CHARS_PER_TOKEN = 4
+
+CANNED_ANSWERS = (
+    "Gir cattle originate from the Saurashtra region of Gujarat. They have a convex forehead, long pendulous "
+    "ears and horns that curve backwards. Cows are docile, heat tolerant and yield A2 milk with good fat content.",
+    "The skin shows a few raised nodules on the neck and flank. Possible conditions include lumpy skin disease, "
+    "dermatophilosis or insect bite reactions. This is not a veterinary diagnosis; please consult a veterinarian.",
+    "Sahiwal is among the best indigenous dairy breeds, with a reddish brown coat, loose skin and a heavy "
+    "dewlap. It tolerates heat and ticks well and is widely used in breed improvement programs across India.",
+)
+
+
+def _delay(seconds):
+    time.sleep(max(0.0, seconds + random.uniform(-JITTER, JITTER)))
+
+
+def _maybe_fail():
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        if random.random() < 0.5:
+            raise exceptions.ServiceUnavailable('fake backend overloaded')
+        raise exceptions.ResourceExhausted('fake quota exceeded')
+
+
+def _prompt_tokens(request):
+    """Rough token count of the content sent inline, including the system instruction."""
+    contents = list(request.contents)
+    if request.system_instruction:
+        contents.append(request.system_instruction)
+    tokens = 0
+    for content in contents:
+        for part in content.parts:
+            if part.inline_data.data:
+                tokens += IMAGE_TOKENS
+            else:
+                tokens += len(part.text) // CHARS_PER_TOKEN + 1
+    return tokens
+
+
+def _answer():
+    words = random.choice(CANNED_ANSWERS).split()
+    return ' '.join((words * (RESPONSE_WORDS // len(words) + 1))[:RESPONSE_WORDS])
+
+
+def _response(text, prompt_tokens, response_tokens, finished=True, cached_tokens=0):
+    return protos.GenerateContentResponse(
+        candidates=[protos.Candidate(
+            content=protos.Content(role='model', parts=[protos.Part(text=text)]),
+            finish_reason=protos.Candidate.FinishReason.STOP if finished else 0,
+            index=0,
+        )],
+        usage_metadata=protos.GenerateContentResponse.UsageMetadata(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached_tokens,
+            candidates_token_count=response_tokens,
+            total_token_count=prompt_tokens + response_tokens,
+        ),
+    )
+
+
+class FakeCacheClient:
+    """Implements the CacheServiceClient calls the SDK makes for caching.CachedContent."""
+
+    def __init__(self):
+        self.entries = {}
+        self.creates = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, ttl):
+        return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=ttl.total_seconds() or 3600)
+
+    def create_cached_content(self, request, **request_options):
+        cached = request.cached_content
+        tokens = _prompt_tokens(cached)
+        if tokens < CACHE_MIN_TOKENS:
+            raise exceptions.InvalidArgument(
+                f'Cached content is too small. total_token_count={tokens}, min_total_token_count={CACHE_MIN_TOKENS}')
+        with self._lock:
+            self.creates += 1
+            entry = protos.CachedContent(
+                name=f'cachedContents/fake-{self.creates}',
+                model=cached.model,
+                display_name=cached.display_name,
+                expire_time=self._expire(cached.ttl),
+                usage_metadata=protos.CachedContent.UsageMetadata(total_token_count=tokens),
+            )
+            self.entries[entry.name] = (entry, tokens)
+        return entry
+
+    def get_cached_content(self, request=None, name=None, **request_options):
+        return self.lookup(name or request.name)[0]
+
+    def update_cached_content(self, request, **request_options):
+        entry = self.lookup(request.cached_content.name)[0]
+        entry.expire_time = self._expire(request.cached_content.ttl)
+        return entry
+
+    def list_cached_contents(self, request=None, **request_options):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            return [entry for entry, _ in self.entries.values() if entry.expire_time >= now]
+
+    def delete_cached_content(self, request=None, name=None, **request_options):
+        with self._lock:
+            self.entries.pop(name or request.name, None)
+
+    def lookup(self, name):
+        """The entry and its token count, as the API would resolve a cached_content reference."""
+        with self._lock:
+            found = self.entries.get(name)
+        if found is None or found[0].expire_time < datetime.datetime.now(datetime.timezone.utc):
+            raise exceptions.NotFound(f'CachedContent not found (or permission denied): {name}')
+        return found
+
+
+class FakeClient:
+    """Implements the two GenerativeServiceClient calls the SDK makes for generate_content."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._lock = threading.Lock()
+
+    def _record(self, request):
+        """Count the call and sleep for prompt processing; return (prompt tokens, cached tokens)."""
+        tokens = _prompt_tokens(request)
+        cached = self.cache.lookup(request.cached_content)[1] if request.cached_content else 0
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += tokens + cached
+            self.cached_tokens += cached
+        time.sleep(tokens * PROMPT_SECONDS_PER_TOKEN)
+        return tokens + cached, cached
+
+    def generate_content(self, request, **request_options):
+        prompt_tokens, cached_tokens = self._record(request)
+        _delay(LATENCY)
+        _maybe_fail()
+        text = _answer()
+        return _response(text, prompt_tokens, len(text) // CHARS_PER_TOKEN, cached_tokens=cached_tokens)
+
+    def stream_generate_content(self, request, **request_options):
+        prompt_tokens, cached_tokens = self._record(request)
+        _delay(FIRST_CHUNK)
+        _maybe_fail()
+        words = _answer().split()
+        size = max(1, -(-len(words) // STREAM_CHUNKS))
+        chunks = [' '.join(words[i:i + size]) + ' ' for i in range(0, len(words), size)]
+        pause = max(0.0, LATENCY - FIRST_CHUNK) / max(1, len(chunks) - 1)
+        sent = 0
+        for i, chunk in enumerate(chunks):
+            if i:
+                _delay(pause)
+            sent += len(chunk) // CHARS_PER_TOKEN
+            yield _response(chunk, prompt_tokens, sent, finished=i == len(chunks) - 1, cached_tokens=cached_tokens)
+
+
+fake_cache_client = FakeCacheClient()
+fake_client = FakeClient(fake_cache_client)
+
+
+def install():
+    """Route every GenerativeModel and CachedContent in this process to the fake backend."""
+    client.get_default_generative_client = lambda: fake_client
+    client.get_default_cache_client = lambda: fake_cache_client
+    # caching imported the getter by name
+    caching.get_default_cache_client = client.get_default_cache_client
+    return fake_client
@@ -0,0 +1,340 @@
+# bench/load.py
+"""Replay a realistic traffic mix against the API and report RPS, latency and memory.
+
+    # against a running server
+    python -m bench.load --url http://127.0.0.1:5000 --duration 30 --users 32
+
+    # start gunicorn with the fake Gemini backend for each workers x threads config
+    python -m bench.load --spawn --configs 1x16,2x32,4x64 --duration 20 --users 64 -o results.json
+
+Every virtual user loops until the deadline, picking a scenario by weight:
+  text   /text_to_text with a varied prompt (unique per request, so the cache is not measured)
+  image  /image_to_text with a small (800x600) or large (4000x3000) photo
+  chat   a multi-turn /api/chatBreed session of 2-6 messages, the first sometimes with a photo
+With --spawn the server's workers are sampled for RSS while the load runs.
+Set FAKE_* variables (see bench/fake_genai.py) to change the simulated model.
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+from PIL import Image, ImageFilter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEXT_PROMPTS = (
+    "Which indigenous breed suits a small farm in {place}?",
+    "How should I care for a pregnant {breed} cow during summer in {place}?",
+    "Explain the benefits of A2 milk from {breed} cows for children",
+    "What ideal breeding conditions does the {breed} breed need in {place}?",
+    "Compare {breed} with other desi breeds for a dairy farmer in {place}",
+)
+CHAT_MESSAGES = (
+    "What breed is this cow?",
+    "How much feed does a {breed} cow need each day?",
+    "Is this animal healthy for breeding?",
+    "What vaccinations are recommended for {breed} calves?",
+    "How can I improve milk yield naturally?",
+    "Which government schemes support {breed} conservation in {place}?",
+)
+BREEDS = ('Gir', 'Sahiwal', 'Red Sindhi', 'Tharparkar', 'Kankrej', 'Rathi', 'Ongole', 'Hariana')
+PLACES = ('Rajasthan', 'Gujarat', 'Punjab', 'Karnataka', 'Bihar', 'Tamil Nadu', 'Maharashtra')
+LANGUAGES = ('en', 'en', 'en', 'hi', 'ta', 'mr')
+
+
+def make_photo(width, height, seed):
+    """A JPEG with enough texture to compress like a real photo."""
+    rng = random.Random(seed)
+    image = Image.effect_noise((width // 4, height // 4), 60).convert('RGB').resize((width, height))
+    tint = Image.new('RGB', (width, height), (rng.randrange(80, 200), rng.randrange(60, 160), rng.randrange(40, 120)))
+    image = Image.blend(image, tint, 0.6).filter(ImageFilter.SMOOTH)
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=90)
+    return base64.b64encode(out.getvalue()).decode()
+
+
+def fill(template):
+    return template.format(breed=random.choice(BREEDS), place=random.choice(PLACES))
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+        self.recording = False
+
+    def add(self, route, status, seconds):
+        if self.recording:
+            with self._lock:
+                self.samples.append((route, status, seconds))
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, url, deadline, weights, photos, large_ratio, stream_ratio, recorder):
+        super().__init__(daemon=True)
+        self.url = url
+        self.deadline = deadline
+        self.scenarios = [name for name, weight in weights.items() for _ in range(weight)]
+        self.photos = photos
+        self.large_ratio = large_ratio
+        self.stream_ratio = stream_ratio
+        self.recorder = recorder
+        self.http = requests.Session()
+
+    def post(self, route, payload):
+        if random.random() < self.stream_ratio and route != '/image_to_text':
+            payload['stream'] = True
+        start = time.perf_counter()
+        try:
+            # Streamed bodies are read to the end, so latency is time to the last chunk
+            response = self.http.post(self.url + route, json=payload, timeout=120)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 'error'
+        self.recorder.add(route, status, time.perf_counter() - start)
+        # Turned away by admission control: back off as a real client would
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if status in (429, 503) and retry_after:
+            time.sleep(min(float(retry_after), max(0.0, self.deadline - time.monotonic())))
+
+    def photo(self):
+        return random.choice(self.photos['large' if random.random() < self.large_ratio else 'small'])
+
+    def text(self):
+        prompt = f"{fill(random.choice(TEXT_PROMPTS))} (ref {uuid.uuid4().hex[:8]})"
+        self.post('/text_to_text', {'prompt': prompt, 'language': random.choice(LANGUAGES)})
+
+    def image(self):
+        self.post('/image_to_text', {'image_base64': self.photo(), 'language': random.choice(LANGUAGES)})
+
+    def chat(self):
+        user_id = uuid.uuid4().hex
+        for turn in range(random.randint(2, 6)):
+            if time.monotonic() >= self.deadline:
+                return
+            payload = {'user_id': user_id, 'session_id': 's1', 'message': fill(random.choice(CHAT_MESSAGES)),
+                       'language': random.choice(LANGUAGES)}
+            if turn == 0 and random.random() < 0.5:
+                payload['image'] = self.photo()
+            self.post('/api/chatBreed', payload)
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            getattr(self, random.choice(self.scenarios))()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, seconds):
+    routes = {}
+    for route, status, latency in samples:
+        routes.setdefault(route, []).append((status, latency))
+    routes['all'] = [(status, latency) for _, status, latency in samples]
+
+    report = {}
+    for route, results in routes.items():
+        latencies = sorted(latency for status, latency in results if status == 200)
+        report[route] = {
+            'requests': len(results),
+            'shed': sum(1 for status, _ in results if status in (429, 503)),
+            'errors': sum(1 for status, _ in results if status not in (200, 429, 503)),
+            'rps': round(len(latencies) / seconds, 2),
+            **{f'p{q}_ms': round(percentile(latencies, q) * 1000, 1) if latencies else None for q in (50, 95, 99)},
+        }
+    return report
+
+
+def worker_pids(master_pid):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == master_pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return pids
+
+
+def rss_mib(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, master_pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for pid in worker_pids(self.master_pid):
+                rss = rss_mib(pid)
+                if rss is not None:
+                    self.peak[pid] = max(rss, self.peak.get(pid, 0))
+
+    def report(self):
+        peaks = sorted(self.peak.values())
+        return {
+            'workers': len(peaks),
+            'peak_rss_mib_per_worker': [round(p, 1) for p in peaks],
+            'peak_rss_mib_total': round(sum(peaks), 1),
+        }
+
+
+def spawn_server(workers, threads, port, env_overrides):
+    env = {
+        **os.environ,
+        'WEB_CONCURRENCY': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        'ACCESS_LOG': os.environ.get('ACCESS_LOG', 'false'),
+        **env_overrides,
+    }
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'bench.fake_app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(300):
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with {process.returncode}')
+        try:
+            requests.get(url + '/', timeout=1)
+            # All workers must be up, not just the first
+            if len(worker_pids(process.pid)) >= workers:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def run_load(url, args, master_pid=None):
+    photos = {
+        'small': [make_photo(800, 600, seed) for seed in range(3)],
+        'large': [make_photo(4000, 3000, seed) for seed in range(2)],
+    }
+    recorder = Recorder()
+    sampler = RssSampler(master_pid) if master_pid else None
+    start = time.monotonic()
+    deadline = start + args.warmup + args.duration
+    users = [VirtualUser(url, deadline, args.mix, photos, args.large_ratio, args.stream_ratio, recorder)
+             for _ in range(args.users)]
+    for user in users:
+        user.start()
+    if sampler:
+        sampler.start()
+    time.sleep(args.warmup)
+    recorder.recording = True
+    measured_from = time.monotonic()
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - measured_from
+    recorder.recording = False
+
+    result = {'routes': summarize(recorder.samples, elapsed), 'seconds': round(elapsed, 1)}
+    if sampler:
+        sampler.stopped.set()
+        result['memory'] = sampler.report()
+    return result
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ('text', 'image', 'chat'):
+            raise argparse.ArgumentTypeError(f'unknown scenario {name!r}')
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def parse_configs(value):
+    return [tuple(int(n) for n in config.split('x')) for config in value.split(',')]
+
+
+def print_report(label, result):
+    print(f"\n== {label} ({result['seconds']}s measured)")
+    print(f"{'route':<18}{'requests':>9}{'shed':>9}{'errors':>9}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, row in sorted(result['routes'].items(), key=lambda item: item[0] == 'all'):
+        cells = [row['requests'], row['shed'], row['errors'], row['rps'], row['p50_ms'], row['p95_ms'], row['p99_ms']]
+        print(f"{route:<18}" + ''.join(f"{'-' if c is None else c:>9}" for c in cells))
+    memory = result.get('memory')
+    if memory:
+        print(f"workers: {memory['workers']}, peak RSS per worker (MiB): {memory['peak_rss_mib_per_worker']}, "
+              f"total: {memory['peak_rss_mib_total']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='base URL of a running server')
+    target.add_argument('--spawn', action='store_true', help='start gunicorn with the fake backend per config')
+    parser.add_argument('--configs', type=parse_configs, default=[(2, 32)],
+                        help='with --spawn: comma-separated WORKERSxTHREADS (default: 2x32)')
+    parser.add_argument('--port', type=int, default=5099, help='with --spawn (default: %(default)s)')
+    parser.add_argument('--pid', type=int, help='gunicorn master PID to sample worker RSS when using --url')
+    parser.add_argument('--users', type=int, default=32, help='concurrent virtual users (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds (default: %(default)s)')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds first (default: %(default)s)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('text=5,image=2,chat=3'),
+                        help='scenario weights (default: text=5,image=2,chat=3)')
+    parser.add_argument('--large-ratio', type=float, default=0.3, help='share of large photos (default: %(default)s)')
+    parser.add_argument('--stream-ratio', type=float, default=0.3,
+                        help='share of text/chat requests that stream (default: %(default)s)')
+    parser.add_argument('-o', '--output', help='write all results as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    if args.url:
+        result = run_load(args.url.rstrip('/'), args, master_pid=args.pid)
+        print_report(args.url, result)
+        results.append({'url': args.url, **result})
+    else:
+        for workers, threads in args.configs:
+            process, url = spawn_server(workers, threads, args.port, {})
+            try:
+                result = run_load(url, args, master_pid=process.pid)
+            finally:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=60)
+            print_report(f'{workers} workers x {threads} threads', result)
+            results.append({'workers': workers, 'threads': threads, **result})
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': {k: v for k, v in vars(args).items() if k != 'output'}, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
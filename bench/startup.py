@@ -0,0 +1,120 @@
+# bench/startup.py
+"""Measure how fast the app starts: import time, and how soon gunicorn serves.
+
+    # slowest imports of `import app` (python -X importtime, by cumulative time)
+    python -m bench.startup --profile
+
+    # import time, then time until gunicorn (bench.fake_app:app) answers /
+    # and a first model call, without and with GUNICORN_PRELOAD
+    python -m bench.startup --runs 5 --workers 2
+
+"ready" is the time from starting gunicorn until every worker is up and `/`
+answers; "first answer" is until a /text_to_text request that calls the
+(fake) model succeeds.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+from bench.load import ROOT, worker_pids
+
+IMPORT_SNIPPET = 'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+
+
+def import_seconds(module):
+    """Wall time of importing `module` in a fresh interpreter."""
+    output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET.format(module=module)],
+                            cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return float(output.split()[-1])
+
+
+def import_profile(module, top):
+    """The `top` slowest imports under `module` as (cumulative ms, self ms, name)."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us) / 1000, int(self_us) / 1000, name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def start_seconds(workers, port, preload, timeout=60):
+    """Start gunicorn and return (ready, first answer) in seconds."""
+    env = {
+        **os.environ,
+        'WEB_CONCURRENCY': str(workers),
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        'GUNICORN_PRELOAD': 'true' if preload else 'false',
+        'ACCESS_LOG': 'false',
+        'FAKE_LATENCY_MS': os.environ.get('FAKE_LATENCY_MS', '0'),
+        'FAKE_JITTER_MS': os.environ.get('FAKE_JITTER_MS', '0'),
+    }
+    url = f'http://127.0.0.1:{port}'
+    start = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'bench.fake_app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = None
+        while ready is None:
+            if process.poll() is not None:
+                raise RuntimeError(f'gunicorn exited with {process.returncode}')
+            if time.monotonic() - start > timeout:
+                raise RuntimeError('gunicorn did not start')
+            try:
+                requests.get(url + '/', timeout=1)
+                if len(worker_pids(process.pid)) >= workers:
+                    ready = time.monotonic() - start
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        response = requests.post(url + '/text_to_text', json={'prompt': 'How do I care for a calf in winter?'},
+                                 timeout=timeout)
+        response.raise_for_status()
+        return ready, time.monotonic() - start
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def median_ms(values):
+    return round(statistics.median(values) * 1000)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', action='store_true', help='print the slowest imports and exit')
+    parser.add_argument('--module', default='app', help='module to import (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=25, help='imports listed by --profile (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=5, help='repetitions, the median is reported (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=5098, help='(default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile:
+        print(f"{'cumulative ms':>14}{'self ms':>9}  import")
+        for cumulative, own, name in import_profile(args.module, args.top):
+            print(f'{cumulative:>14.1f}{own:>9.1f}  {name}')
+        return
+
+    imports = [import_seconds(args.module) for _ in range(args.runs)]
+    print(f'import {args.module}: {median_ms(imports)} ms')
+    for preload in (False, True):
+        runs = [start_seconds(args.workers, args.port, preload) for _ in range(args.runs)]
+        print(f"gunicorn {args.workers} workers, preload {'on' if preload else 'off'}: "
+              f"ready {median_ms([r for r, _ in runs])} ms, first answer {median_ms([a for _, a in runs])} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+# breeds.py
+"""Static facts on the 43 recognized indigenous cattle breeds.
+
+With BREED_DIRECT_ANSWERS, explicit fact questions ("milk yield of Sahiwal",
+"where is Kangayam from") are answered directly from this table; other
+questions that name a breed get its facts
+appended as grounding for the model. Milk yields are rounded average
+per-lactation figures from the ICAR-NBAGR breed descriptors, and are only
+listed for breeds where that figure is well established.
+"""
+import os
+import re
+from collections import namedtuple
+
+# Answer single-fact English questions without calling the model
+DIRECT_ANSWERS = os.environ.get('BREED_DIRECT_ANSWERS', 'false').lower() in ('1', 'true', 'yes')
+# Append the facts of breeds named in a question to the model prompt
+GROUNDING = os.environ.get('BREED_GROUNDING', 'true').lower() in ('1', 'true', 'yes')
+GROUNDING_MAX_BREEDS = 3
+
+Breed = namedtuple('Breed', 'name aliases region purpose traits milk_yield')
+
+BREEDS = (
+    Breed('Amritmahal', ('amrit mahal',), 'Karnataka (Chikkamagaluru, Chitradurga, Hassan)', 'draught',
+          'grey coat, long backward-curving pointed horns, compact muscular body bred for speed and endurance', None),
+    Breed('Bachaur', (), 'Bihar (Sitamarhi, Madhubani, Darbhanga)', 'draught',
+          'grey or grey-white coat, compact body, short stumpy horns', None),
+    Breed('Bargur', (), 'Tamil Nadu (Bargur hills, Erode)', 'draught',
+          'brown coat with white patches, compact hill cattle known for a fiery temperament', None),
+    Breed('Dangi', ('dangs',), 'Maharashtra (Nashik, Ahmednagar) and Gujarat (Dangs)', 'draught',
+          'white coat with black spots, oily skin that sheds heavy rain, suited to hilly high-rainfall tracts', None),
+    Breed('Deoni', ('dongarpati',), 'Maharashtra (Latur, Marathwada) and Karnataka (Bidar)', 'dual-purpose',
+          'black-and-white spotted coat, prominent forehead and drooping ears similar to Gir', 870),
+    Breed('Gaolao', (), 'Maharashtra (Wardha, Nagpur) and Madhya Pradesh (Chhindwara)', 'draught',
+          'white to light grey coat, long narrow face, short stumpy horns', None),
+    Breed('Gir', ('gyr', 'sorthi', 'desan'), 'Gujarat (Saurashtra, Gir forest region)', 'dairy',
+          'convex bulging forehead, long pendulous folded ears, horns curving back in a half-moon, '
+          'red to speckled red-white coat', 2110),
+    Breed('Hallikar', (), 'Karnataka (Mysuru, Mandya, Tumakuru)', 'draught',
+          'grey to dark grey coat, long vertical backward-sweeping horns, the foundation of the Mysore type', None),
+    Breed('Hariana', (), 'Haryana (Rohtak, Hisar, Jind), with herds in Uttar Pradesh and Rajasthan', 'dual-purpose',
+          'white or light grey coat, compact body, long narrow face, short horns', 1000),
+    Breed('Kangayam', ('kangeyam',), 'Tamil Nadu (Erode, Tiruppur, Karur)', 'draught',
+          'grey-white coat with darker bulls, stout spreading horns, very strong draught animal', None),
+    Breed('Kankrej', ('wadad', 'talabda'), 'Gujarat (Banaskantha, Kutch) and Rajasthan (Barmer, Jalore)', 'dual-purpose',
+          'silver-grey to iron-grey coat, large lyre-shaped horns, a distinctive fast gait (sawai chal)', 1740),
+    Breed('Kenkatha', ('kenwariya',), 'Uttar Pradesh (Banda, Lalitpur) and Madhya Pradesh (Tikamgarh)', 'draught',
+          'small sturdy grey cattle of the Ken river tract', None),
+    Breed('Kherigarh', (), 'Uttar Pradesh (Lakhimpur Kheri)', 'draught',
+          'white coat, upstanding horns, active and alert', None),
+    Breed('Khillar', ('khillari',), 'Maharashtra (Satara, Sangli, Kolhapur, Solapur) and Karnataka (Vijayapura, Belagavi)',
+          'draught', 'greyish-white coat, long pointed backward-sweeping horns, compact body, fast draught animal', None),
+    Breed('Krishna Valley', (), 'Karnataka (Belagavi, Vijayapura) and Maharashtra (Sangli)', 'draught',
+          'grey-white coat, massive body with a deep chest, heavy draught animal', 920),
+    Breed('Malvi', ('malwi', 'manthani'), 'Madhya Pradesh (Malwa: Ujjain, Shajapur, Indore) and Rajasthan (Jhalawar)',
+          'draught', 'grey to white coat, short strong horns, heavy hump', None),
+    Breed('Mewati', ('kosi',), 'Rajasthan (Alwar, Bharatpur), Haryana (Nuh) and Uttar Pradesh (Mathura)', 'draught',
+          'white coat with darker neck and hump', 960),
+    Breed('Nagori', (), 'Rajasthan (Nagaur)', 'draught',
+          'white or light grey coat, long narrow face, renowned fast trotting bullocks', 600),
+    Breed('Nimari', (), 'Madhya Pradesh (Khargone, Barwani, Narmada valley)', 'draught',
+          'red coat with white splashes, copper-coloured horns', None),
+    Breed('Ongole', (), 'Andhra Pradesh (Prakasam, Guntur, Nellore)', 'dual-purpose',
+          'large white body, short stumpy horns, well-developed hump, an ancestor of the American Brahman', 800),
+    Breed('Ponwar', (), 'Uttar Pradesh (Pilibhit, Lakhimpur Kheri)', 'draught',
+          'black-and-white patched coat, narrow face, long horns, aggressive temperament', None),
+    Breed('Punganur', (), 'Andhra Pradesh (Chittoor)', 'dairy',
+          'one of the smallest cattle in the world (about 70-90 cm), white, grey or light brown, rich high-fat milk', 550),
+    Breed('Rathi', (), 'Rajasthan (Bikaner, Sri Ganganagar)', 'dairy',
+          'brown coat with white patches, medium size, well suited to the Thar desert', 1560),
+    Breed('Red Kandhari', ('kandhari',), 'Maharashtra (Nanded, Latur, Parbhani)', 'draught',
+          'uniform deep dark red coat, medium horns', None),
+    Breed('Red Sindhi', ('malir',), 'originally Sindh; maintained in organized herds across India', 'dairy',
+          'deep red coat, compact body, highly heat tolerant', 1840),
+    Breed('Sahiwal', ('lola', 'montgomery'), 'Punjab and Haryana, with herds in Rajasthan (native tract in Punjab, Pakistan)',
+          'dairy', 'reddish-brown coat, loose skin, heavy dewlap, short horns, among the best indigenous dairy breeds', 2325),
+    Breed('Siri', (), 'Sikkim and Darjeeling (West Bengal)', 'draught',
+          'black, or brown with white patches, thick coat, strong hill draught animal', None),
+    Breed('Tharparkar', ('thari', 'white sindhi'), 'Rajasthan (Barmer, Jaisalmer, Jodhpur), originally Tharparkar in Sindh',
+          'dual-purpose', 'white or light grey coat, lyre-shaped horns, very hardy in drought', 1750),
+    Breed('Umblachery', ('jathi madu',), 'Tamil Nadu (Thanjavur, Tiruvarur, Nagapattinam)', 'draught',
+          'grey coat, calves born red, white markings on face and legs, suited to marshy rice fields', None),
+    Breed('Vechur', (), 'Kerala (Kottayam)', 'dairy',
+          'dwarf cattle (about 90 cm), light red, black or white, highly disease resistant', 560),
+    Breed('Motu', (), 'Odisha (Malkangiri), with herds in Chhattisgarh and Andhra Pradesh', 'draught',
+          'small red-brown cattle suited to hilly forest terrain', None),
+    Breed('Ghumusari', (), 'Odisha (Ganjam, Kandhamal)', 'draught',
+          'small white or grey cattle used in paddy fields', None),
+    Breed('Binjharpuri', (), 'Odisha (Jajpur, Kendrapara, Cuttack)', 'dual-purpose',
+          'white or light grey coat, medium size', None),
+    Breed('Khariar', (), 'Odisha (Nuapada, Kalahandi)', 'draught',
+          'small hardy grey-brown cattle', None),
+    Breed('Pulikulam', ('jallikattu madu',), 'Tamil Nadu (Madurai, Sivaganga, Virudhunagar)', 'draught',
+          'grey coat with darker bulls, kept in migratory herds, the bulls used in Jallikattu', None),
+    Breed('Kosali', (), 'Chhattisgarh (central plains)', 'draught',
+          'small cattle with light red or white-grey coat and short horns', None),
+    Breed('Malnad Gidda', ('malenadu gidda',), 'Karnataka (Western Ghats: Shivamogga, Uttara Kannada, Chikkamagaluru)',
+          'dairy', 'dwarf black or brown cattle that browse forest foliage, very disease resistant', None),
+    Breed('Belahi', ('morni',), 'Haryana (Ambala, Panchkula, Yamunanagar) and Chandigarh', 'dual-purpose',
+          'red or brown coat with white face and legs, reared by migratory Gujjar herders', None),
+    Breed('Gangatiri', (), 'Uttar Pradesh (Ballia, Ghazipur, Varanasi) and Bihar (Bhojpur, Buxar)', 'dual-purpose',
+          'grey or white coat, cattle of the Ganga plains', None),
+    Breed('Badri', (), 'Uttarakhand (hill districts)', 'dual-purpose',
+          'small black, brown or grey hill cattle that graze forest slopes', None),
+    Breed('Lakhimi', (), 'Assam', 'dual-purpose',
+          'small hardy red, brown or black cattle, the most numerous native cattle of Assam', None),
+    Breed('Ladakhi', (), 'Ladakh (Leh, Kargil)', 'dual-purpose',
+          'small black or brown cattle with a thick coat, adapted to high-altitude cold', None),
+    Breed('Konkan Kapila', (), 'Maharashtra (Ratnagiri, Sindhudurg) and Goa', 'dual-purpose',
+          'small cattle of varied colour, mostly brown, adapted to the heavy-rainfall coast', None),
+)
+
+_BY_NAME = {alias: breed for breed in BREEDS for alias in (breed.name.lower(), *breed.aliases)}
+# Longest names first so "red sindhi" wins over "sindhi"
+_NAME_PATTERN = re.compile(
+    r"\b(%s)\b" % "|".join(re.escape(name) for name in sorted(_BY_NAME, key=len, reverse=True)),
+    re.IGNORECASE)
+
+# Whole questions answered from the table, {breed} standing for one breed name.
+# Anything more ("milk production of Gir drops in summer", "what does a Gir calf
+# look like at birth") goes to the model
+_ANIMAL = r"( (cow|cows|bull|bulls|cattle|breed))?"
+_TEMPLATES = {
+    'milk_yield': (
+        r"(what is )?(the )?(average )?milk (yield|production|output) of (the |a )?{breed}" + _ANIMAL,
+        r"how much milk (does|do) (the |a )?{breed}" + _ANIMAL + r" (give|produce|yield)( per lactation)?",
+    ),
+    'region': (
+        r"where (is|are|does|do) (the )?{breed}" + _ANIMAL + r" (from|found|come from|reared)",
+        r"(what is )?(the )?(origin|native (region|tract|state|place)|home tract) of (the )?{breed}" + _ANIMAL,
+        r"which (state|region) (is|are|does|do) (the )?{breed}" + _ANIMAL + r" (from|come from|belong to)",
+    ),
+    'traits': (
+        r"how (to|do you|do i|can i) (identify|recogni[sz]e) (the |a |an )?{breed}" + _ANIMAL,
+        r"what (does|do) (the |a |an )?{breed}" + _ANIMAL + r" look like",
+        r"(describe|(what are )?(the )?(characteristics|features|traits) of|appearance of) (the |a |an )?{breed}"
+        + _ANIMAL,
+    ),
+    'purpose': (
+        r"what (is|are) (the |a |an )?{breed}" + _ANIMAL + r" used for",
+        r"(what is )?(the )?purpose of (the |a |an )?{breed}" + _ANIMAL,
+        r"is (the |a |an )?{breed}" + _ANIMAL + r" an? (dairy|draught|draft) or (dairy|draught|draft)( breed)?",
+    ),
+}
+_FIELD_PATTERNS = {
+    field: [re.compile(template.format(breed=f"(?P<breed>{_NAME_PATTERN.pattern})"), re.IGNORECASE)
+            for template in templates]
+    for field, templates in _TEMPLATES.items()
+}
+
+_ANSWERS = {
+    'milk_yield': "{0.name} ({0.purpose}) gives on average about {0.milk_yield} kg of milk per lactation.",
+    'region': "{0.name} is native to {0.region}.",
+    'traits': "{0.name} ({0.purpose}): {0.traits}.",
+    'purpose': "{0.name} is a {0.purpose} breed from {0.region}.",
+}
+
+
+def find_breeds(text):
+    """Breeds named in `text`, in order of first mention."""
+    found = []
+    for match in _NAME_PATTERN.finditer(text or ''):
+        breed = _BY_NAME[match.group(1).lower()]
+        if breed not in found:
+            found.append(breed)
+    return found
+
+
+def match(question):
+    """(breed, field) when the whole question asks for one fact the table holds, else None.
+
+    >>> match("Milk yield of Sahiwal?")[1], match("where is Kangayam from")[1]
+    ('milk_yield', 'region')
+    >>> match("What does a Gir look like?")[1], match("Is Ongole a dairy or draught breed?")[1]
+    ('traits', 'purpose')
+    >>> [match(q) for q in (
+    ...     "Milk production of Gir drops in summer, what can I do?",
+    ...     "Describe the process of making ghee from Gir milk",
+    ...     "Describe Panchgavya using Gir cow",
+    ...     "What does a Gir calf look like at birth?",
+    ...     "Origin of the name Kankrej",
+    ...     "My Gir cow looks weak and is not eating",
+    ...     "Sahiwal horn broken, what to do",
+    ...     "my Tharparkar has a wound on its horn",
+    ...     "Ongole bull looks aggressive",
+    ... )]
+    [None, None, None, None, None, None, None, None, None]
+    """
+    question = ' '.join((question or '').split()).rstrip('?.! ')
+    for field, patterns in _FIELD_PATTERNS.items():
+        for pattern in patterns:
+            found = pattern.fullmatch(question)
+            if found:
+                breed = _BY_NAME[found.group('breed').strip().lower()]
+                return (breed, field) if getattr(breed, field) is not None else None
+    return None
+
+
+def lookup(question):
+    """Answer a one-breed, one-fact question from the table, or None to ask the model."""
+    if not DIRECT_ANSWERS:
+        return None
+    found = match(question)
+    return _ANSWERS[found[1]].format(found[0]) if found else None
+
+
+def describe(breed):
+    facts = f"{breed.name}: {breed.purpose}; {breed.region}; {breed.traits}"
+    if breed.milk_yield:
+        facts += f"; average milk yield about {breed.milk_yield} kg per lactation"
+    return facts
+
+
+def grounding(text):
+    """Reference facts for the breeds named in `text`, to append to a model prompt ('' if none)."""
+    if not GROUNDING:
+        return ''
+    breeds = find_breeds(text)[:GROUNDING_MAX_BREEDS]
+    if not breeds:
+        return ''
+    return "\n\nReference facts:\n" + "\n".join(f"- {describe(breed)}" for breed in breeds)
@@ -0,0 +1,135 @@
+# chat_history.py
+import os
+
+import metrics
+from generation import generate
+from logs import log
+from model_registry import get_model
+
+# Most recent user/model turns sent verbatim to the model
+WINDOW_TURNS = int(os.environ.get('HISTORY_WINDOW_TURNS', 6))
+# Most recent turns that keep their images; older images become a placeholder
+IMAGE_TURNS = int(os.environ.get('HISTORY_IMAGE_TURNS', 1))
+# Fold turns that fall out of the window into a summary instead of dropping them
+SUMMARIZE = os.environ.get('HISTORY_SUMMARIZE', '').lower() in ('1', 'true', 'yes')
+
+IMAGE_PLACEHOLDER = "[image omitted]"
+SUMMARY_PREFIX = "[Summary of the earlier conversation]"
+SUMMARY_ACK = "Understood, I will keep this context in mind."
+SUMMARY_SUFFIX = "#summary"
+SUMMARY_PROMPT = """Summarize this conversation between a farmer and an expert on Indian indigenous cow breeds
+in under 120 words. Keep breed names, animal health observations, numbers and any decisions made,
+and write in the language the farmer used.
+
+"""
+SUMMARY_GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "max_output_tokens": 200,
+}
+
+
+def _turns(history):
+    return [history[i:i + 2] for i in range(0, len(history), 2)]
+
+
+def _text(content):
+    return " ".join(part.text if part.text else IMAGE_PLACEHOLDER for part in content.parts)
+
+
+def _strip_images(content):
+    if not any(part.inline_data.data for part in content.parts):
+        return content
+    from google.generativeai import protos
+    parts = [protos.Part(text=IMAGE_PLACEHOLDER) if part.inline_data.data else part for part in content.parts]
+    return protos.Content(role=content.role, parts=parts)
+
+
+def _is_summary(turn):
+    return turn[0].parts and turn[0].parts[0].text.startswith(SUMMARY_PREFIX)
+
+
+def summarize(turns, previous_summary=None):
+    lines = [previous_summary] if previous_summary else []
+    for turn in turns:
+        for content in turn:
+            lines.append(f"{content.role}: {_text(content)}")
+    model = get_model(generation_config=SUMMARY_GENERATION_CONFIG)
+    generated = generate(model.generate_content, SUMMARY_PROMPT + "\n".join(lines), 'history_summary')
+    if generated.text is None:
+        raise ValueError(f"no summary (finish reason: {generated.finish_reason})")
+    metrics.incr('history_summaries_total')
+    return generated.text.strip()
+
+
+def _summary_turn(summary):
+    from google.generativeai import protos
+    return [
+        protos.Content(role='user', parts=[protos.Part(text=f"{SUMMARY_PREFIX}\n{summary}")]),
+        protos.Content(role='model', parts=[protos.Part(text=SUMMARY_ACK)]),
+    ]
+
+
+def summary_key(session_key):
+    """Where the summary of a session is stored, apart from its history."""
+    return f"{session_key}{SUMMARY_SUFFIX}"
+
+
+def _uncovered(turns, boundary):
+    """The turns after `boundary`, the last turn a summary covers; all of them
+    once the session store has trimmed that turn away."""
+    boundary = [_strip_images(content) for content in boundary]
+    for i in range(len(turns) - 1, -1, -1):
+        if [_strip_images(content) for content in turns[i]] == boundary:
+            return turns[i + 1:]
+    return turns
+
+
+def compact_history(history, store=None, session_key=None):
+    """Bound what a chat re-sends on its next message; `history` itself is not changed.
+
+    Only the last WINDOW_TURNS turns are kept, and images survive only in
+    the last IMAGE_TURNS turns. With HISTORY_SUMMARIZE, turns leaving the
+    window are folded into a summary turn at the head of the copy. The
+    summary is kept in `store` under summary_key(session_key), with the last
+    turn it covers, and is brought up to date in batches once twice the
+    window is uncovered, so the summary call is made once every WINDOW_TURNS
+    messages, not on every one.
+    """
+    turns = _turns(history)
+    # Sessions stored before summaries were kept apart open with one
+    summary = turns.pop(0) if turns and _is_summary(turns[0]) else None
+
+    if SUMMARIZE and store is not None:
+        # [summary user, summary model] + the last covered turn, or only that turn
+        record = store.get(summary_key(session_key)) or []
+        if record:
+            summary, boundary = (record[:2], record[2:]) if len(record) == 4 else (summary, record)
+            turns = _uncovered(turns, boundary)
+
+    if WINDOW_TURNS and len(turns) > WINDOW_TURNS:
+        if not SUMMARIZE:
+            metrics.incr('history_turns_dropped_total', len(turns) - WINDOW_TURNS)
+            turns = turns[-WINDOW_TURNS:]
+        elif len(turns) >= WINDOW_TURNS * 2:
+            older, turns = turns[:-WINDOW_TURNS], turns[-WINDOW_TURNS:]
+            previous = summary[0].parts[0].text[len(SUMMARY_PREFIX):].strip() if summary else None
+            try:
+                summary = _summary_turn(summarize(older, previous))
+            except Exception as e:
+                # Keep serving the chat; the older turns are simply left out
+                log.warning('history summary failed', extra={'fields': {'error': str(e)}})
+                metrics.incr('history_turns_dropped_total', len(older))
+            if store is not None:
+                store.put(summary_key(session_key), (summary or []) + [_strip_images(c) for c in older[-1]])
+
+    cutoff = len(turns) - IMAGE_TURNS
+    turns = [[_strip_images(c) for c in turn] if i < cutoff else turn for i, turn in enumerate(turns)]
+
+    compacted = (summary or []) + [content for turn in turns for content in turn]
+    metrics.incr('history_turns_sent_total', len(turns))
+    return compacted
+
+
+def visible(history):
+    """`history` without summary turns, for showing to the user."""
+    return [content for turn in _turns(history) if not _is_summary(turn) for content in turn]
@@ -0,0 +1,174 @@
+# context_cache.py
+"""Server-side caching of the large, fixed system prompts (Gemini context caching).
+
+With CONTEXT_CACHE_ENABLED, each system prompt is uploaded as a CachedContent
+and requests reference it by name instead of re-sending it, so its tokens are
+billed at the cached rate and not processed again. The display name carries a
+hash of the model and prompt, so workers and restarts adopt a live cache for
+the same prompt instead of uploading another. The TTL is extended in-band once
+less than a quarter of it is left. Whenever no cache is available (disabled,
+creation failed or the model does not support caching), requests send the
+prompt inline exactly as before, and creation is retried after
+CONTEXT_CACHE_RETRY. A prompt below the model's minimum cacheable size (4096
+tokens for Gemini) is never retried.
+"""
+import datetime
+import hashlib
+import os
+import threading
+import time
+
+import metrics
+from logs import log
+from model_registry import genai
+
+ENABLED = os.environ.get('CONTEXT_CACHE_ENABLED', '').lower() in ('1', 'true', 'yes')
+TTL = float(os.environ.get('CONTEXT_CACHE_TTL', 3600))
+# Seconds to wait after a failed creation before trying again
+RETRY_AFTER = float(os.environ.get('CONTEXT_CACHE_RETRY', 600))
+# Extend the TTL once less than this share of it is left
+REFRESH_FRACTION = 0.25
+# Caches listed per page when looking for one to adopt
+LIST_PAGE_SIZE = 100
+
+
+def is_cache_error(error):
+    """The cached content a request referenced is gone or unusable."""
+    from google.api_core import exceptions
+
+    if isinstance(error, (exceptions.NotFound, exceptions.PermissionDenied)):
+        return True
+    return isinstance(error, exceptions.InvalidArgument) and 'cache' in str(error).lower()
+
+
+class ContextCache:
+    """One system prompt cached server-side for one model and generation config."""
+
+    def __init__(self, name, model_name, system_instruction, generation_config=None):
+        self.name = name
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.generation_config = generation_config
+        digest = hashlib.sha256(f'{model_name}\n{system_instruction}'.encode()).hexdigest()[:16]
+        self.display_name = f'gausampada-{name}-{digest}'
+        self._cached = None
+        self._model = None
+        self._expires = 0.0
+        self._retry_at = 0.0
+        self._busy = False
+        self._lock = threading.Lock()
+        metrics.register_stats('context_cache', self.stats, cache=name)
+
+    def _usable(self, now):
+        return self._model if self._model is not None and now < self._expires else None
+
+    def model(self):
+        """The GenerativeModel bound to the cached prompt, or None to send the prompt inline.
+
+        Creation and refresh happen on the calling thread; requests arriving
+        meanwhile keep using the current cache, or go inline if there is none.
+        """
+        if not ENABLED:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            due = self._model is None or self._expires - now < TTL * REFRESH_FRACTION
+            if not due or self._busy or (self._model is None and now < self._retry_at):
+                return self._usable(now)
+            self._busy = True
+        try:
+            if self._model is None:
+                self._create()
+            else:
+                self._refresh()
+        finally:
+            with self._lock:
+                self._busy = False
+        with self._lock:
+            return self._usable(time.monotonic())
+
+    def _find(self, sdk):
+        """A live cache for this model and prompt left by another worker or an earlier run, if any."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for cached in sdk.caching.CachedContent.list(page_size=LIST_PAGE_SIZE):
+            if cached.display_name == self.display_name and cached.expire_time > now:
+                return cached
+        return None
+
+    def _create(self):
+        start = time.monotonic()
+        try:
+            sdk = genai()
+            cached = self._find(sdk)
+            if cached is not None:
+                cached.update(ttl=datetime.timedelta(seconds=TTL))
+                op = 'adopts'
+            else:
+                cached = sdk.caching.CachedContent.create(
+                    model=self.model_name,
+                    display_name=self.display_name,
+                    system_instruction=self.system_instruction,
+                    ttl=datetime.timedelta(seconds=TTL),
+                )
+                op = 'creates'
+            model = sdk.GenerativeModel.from_cached_content(cached, generation_config=self.generation_config)
+        except Exception as e:
+            too_small = 'too small' in str(e).lower()
+            log.warning('context cache create failed', extra={'fields': {
+                'cache': self.name, 'error': str(e), 'retry': not too_small}})
+            metrics.incr('context_cache_errors_total', cache=self.name, op='create')
+            with self._lock:
+                # The prompt will not grow, so neither will a retry succeed
+                self._retry_at = float('inf') if too_small else start + RETRY_AFTER
+            return
+        with self._lock:
+            self._cached, self._model, self._expires = cached, model, start + TTL
+        metrics.incr(f'context_cache_{op}_total', cache=self.name)
+
+    def _refresh(self):
+        start = time.monotonic()
+        try:
+            self._cached.update(ttl=datetime.timedelta(seconds=TTL))
+        except Exception as e:
+            log.warning('context cache refresh failed', extra={'fields': {'cache': self.name, 'error': str(e)}})
+            metrics.incr('context_cache_errors_total', cache=self.name, op='refresh')
+            if is_cache_error(e):
+                self.invalidate()
+            return
+        with self._lock:
+            self._expires = start + TTL
+        metrics.incr('context_cache_refreshes_total', cache=self.name)
+
+    def invalidate(self):
+        with self._lock:
+            self._cached = self._model = None
+            self._expires = 0.0
+
+    def run(self, call, inline):
+        """Return `call(model)` using the cached prompt, or `inline()` when there is none.
+
+        A call that fails because the cache is gone invalidates it and is
+        answered by `inline()` instead.
+        """
+        model = self.model()
+        if model is None:
+            metrics.incr('context_cache_requests_total', cache=self.name, mode='inline')
+            return inline()
+        try:
+            result = call(model)
+        except Exception as e:
+            if not is_cache_error(e):
+                raise
+            log.warning('context cache unusable, sending prompt inline',
+                        extra={'fields': {'cache': self.name, 'error': str(e)}})
+            metrics.incr('context_cache_errors_total', cache=self.name, op='call')
+            self.invalidate()
+            metrics.incr('context_cache_requests_total', cache=self.name, mode='inline')
+            return inline()
+        metrics.incr('context_cache_requests_total', cache=self.name, mode='cached')
+        return result
+
+    def stats(self):
+        with self._lock:
+            remaining = self._expires - time.monotonic() if self._model is not None else 0.0
+        return {'active': int(remaining > 0), 'ttl_remaining_seconds': max(0.0, remaining)}
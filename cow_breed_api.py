@@ -1,59 +1,47 @@
 # cow_breed_api.py
 from flask import Blueprint, request, jsonify
-import google.generativeai as genai
-import os
-from PIL import Image
-import io
-import base64
+from image_pipeline import ImageError, image_cache, image_cache_key, prepare_image
+from chat_history import compact_history, summary_key, visible
+from context_cache import ContextCache
+import admission
+import breeds
+import generation
+import metrics
+from logs import log
+from model_registry import get_model
+from prompts import BREED_SYSTEM_PROMPT, INPUT_PROMPT_PREFIXES, localize
+from scheduler import UpstreamUnavailable
+from session_store import create_session_store
+from streaming import iter_text, stream_requested, stream_text
+from uploads import read_image_request
 
 # Create a Blueprint instead of a Flask app
 cow_breed_bp = Blueprint('cow_breed', __name__)
 
-# Configure the Gemini API with your API key
-genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
-
-# Initialize the model
-model = genai.GenerativeModel(model_name="gemini-2.0-flash-exp")
-
-# System prompt for Indian cow breeds expertise
-SYSTEM_PROMPT = """You are India's foremost authority on indigenous cow breeds (desi gau).
-(STRICT LIMIT: Your responses must never exceed 160 tokens.)
-
-Your specialized knowledge covers:
-- Comprehensive details on all 43 recognized indigenous breeds (Gir, Sahiwal, Red Sindhi, Tharparkar, Kankrej, etc.)
-- Precise breed identifiers: physical traits, horn patterns, dewlap characteristics, hump size, coat colors
-- Scientific data on milk yield, fat content, and A2 beta-casein properties
-- Geographic origins and adaptation mechanisms to specific Indian climates
-- Documented nutritional and medicinal properties of A2 milk, ghee, and panchgavya
-- Vedic, historical and cultural significance in Indian civilization
-- Traditional cow-based sustainable farming systems (Jeevamrut, Beejamrut, etc.)
-- Genetic conservation strategies and breed improvement programs
-- Evidence-based comparisons with foreign/crossbred cattle
-- You are a multilingual image analysis expert. Respond only in the language requested.
-- Do not include English unless explicitly asked. Focus on clarity and use medical terminology as needed.
-When analyzing images:
-- Identify breed with certainty through distinctive markers
-- Assess animal health, age, and condition
-- Note conformity to breed standards
-
-Reply with scientifically accurate, culturally sensitive information.
-When uncertain, openly acknowledge limitations.
-STRICTLY PROVIDE INFORMATION ONLY ABOUT INDIAN INDIGENOUS BREEDS, even when foreign breeds are mentioned.
-Never discuss or recommend foreign or crossbred varieties unless explicitly comparing them to indigenous breeds.
-Include regional terms when appropriate.
-
-REMEMBER: KEEP ALL RESPONSES UNDER 160 TOKENS STRICTLY. Be precise and concise."""
+BREED_MODEL = "gemini-2.0-flash-exp"
+# The same prompt cached server-side, when CONTEXT_CACHE_ENABLED
+breed_context = ContextCache('breed', BREED_MODEL, BREED_SYSTEM_PROMPT)
+
+
+def breed_model():
+    # The system prompt is sent as a model-level instruction instead of priming
+    # every new chat with an extra round-trip. The model is created on first
+    # use, so importing this module does not load the SDK
+    return get_model(BREED_MODEL, system_instruction=BREED_SYSTEM_PROMPT)
+
 
 # Store chat history
-chat_sessions = {}
+chat_sessions = create_session_store()
+metrics.register_stats('session_store', chat_sessions.stats)
 
 @cow_breed_bp.route('/api/chatBreed', methods=['POST'])
+@admission.limit('chatBreed')
 def chat():
     try:
-        data = request.json
+        # JSON with a base64 image, multipart/form-data, or the raw image as the body
+        data, image_bytes = read_image_request('image')
         user_id = data.get('user_id', 'default_user')
         message = data.get('message', '')
-        image_data = data.get('image', None)
         language = data.get('language', 'en')
         session_id = data.get('session_id', 'default_session')
 
@@ -61,47 +49,109 @@ def chat():
         session_key = f"{user_id}_{session_id}"
 
         # Initialize chat for new session
-        if session_key not in chat_sessions:
-            chat_sessions[session_key] = model.start_chat(history=[])
-            chat_sessions[session_key].send_message(SYSTEM_PROMPT, stream=False)
+        with metrics.timer('session'):
+            history = chat_sessions.get(session_key)
+        if history is None:
+            metrics.incr('priming_round_trips_saved')
+        # Only a bounded window of earlier turns is re-sent to the model; the
+        # session keeps them all, within its own SESSION_MAX_TURNS
+        chat = breed_model().start_chat(history=compact_history(history or [], chat_sessions, session_key))
+
+        content_parts = [get_localized_prompt(language_code=language, prompt=message)]
 
-        chat = chat_sessions[session_key]
+        # Single-fact breed questions are answered from the local index
+        answer = breeds.lookup(message) if language == 'en' and not image_bytes else None
+        if answer is not None:
+            metrics.incr('breed_direct_answers_total')
+            chat.history = chat.history + [{'role': 'user', 'parts': content_parts},
+                                           {'role': 'model', 'parts': [answer]}]
+            chat_sessions.put(session_key, (history or []) + chat.history[-2:])
+            if stream_requested(data):
+                return stream_text([answer], done={'session_id': session_id})
+            return jsonify({
+                'response': answer,
+                'session_id': session_id
+            })
+
+        # Facts on breeds the message names go in their own part, so history shows only the message
+        facts = breeds.grounding(message)
+        if facts:
+            content_parts.append(facts.strip())
 
         # Process image if provided
-        content_parts = [get_localized_prompt(language_code=language, prompt=message)]
-        if image_data:
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes))
-            content_parts.append(image)
+        if image_bytes:
+            # Decode, orient and downscale once; the SDK gets ready-to-send JPEG bytes
+            image = prepare_image(image_bytes)
+            content_parts.append(image.as_part())
+
+        # A photo opening a new conversation is cached like /image_to_text
+        cache_key = None
+        if image_cache is not None and image_bytes and not history:
+            cache_key = image_cache_key(image, 'chatBreed', content_parts[0], BREED_MODEL, BREED_SYSTEM_PROMPT)
+            cached = image_cache.get(cache_key)
+            if cached is not None:
+                chat.history = [{'role': 'user', 'parts': content_parts}, {'role': 'model', 'parts': [cached]}]
+                chat_sessions.put(session_key, chat.history)
+                if stream_requested(data):
+                    return stream_text([cached], done={'session_id': session_id})
+                return jsonify({
+                    'response': cached,
+                    'session_id': session_id
+                })
 
-        # Send message to model
-        response = chat.send_message(content_parts, stream=False)
+        # The turn goes to a chat on the cached system prompt when there is one
+        def send(call):
+            def send_with(chat_model):
+                nonlocal chat
+                chat = chat_model.start_chat(history=chat.history)
+                return call(chat.send_message, content_parts)
+            return breed_context.run(send_with, lambda: send_with(breed_model()))
+
+        def on_complete(text):
+            with metrics.timer('session'):
+                chat_sessions.put(session_key, (history or []) + chat.history[-2:])
+            if cache_key is not None:
+                image_cache.set(cache_key, text)
+
+        # Stream the reply as it is generated; the turn is stored once complete
+        if stream_requested(data):
+            response = send(generation.stream)
+            finished = {}
+
+            # A reply stopped midway (e.g. for SAFETY) ends the stream with an error, unstored
+            def on_stream_complete(text):
+                finished['usage'] = generation.finish(response, 'chatBreed').usage
+                on_complete(text)
+
+            return stream_text(iter_text(response), on_complete=on_stream_complete,
+                               done=lambda: {'session_id': session_id, 'usage': finished['usage']})
+
+        # Send message to model; a blocked or empty answer leaves the session unchanged
+        generated = send(lambda fn, contents: generation.generate(fn, contents, 'chatBreed'))
+        if generated.text is None:
+            return jsonify({
+                'error': f'The model returned no answer (finish reason: {generated.finish_reason})'
+            }), 502
+        text = generated.text
+        on_complete(text)
 
         return jsonify({
-            'response': response.text,
-            'session_id': session_id
+            'response': text,
+            'session_id': session_id,
+            'usage': generated.usage
         })
 
+    except ImageError as e:
+        return jsonify({'error': str(e)}), 400
+    except UpstreamUnavailable as e:
+        log.warning('chatBreed upstream unavailable', extra={'fields': {'error': str(e)}})
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
+        log.exception('chatBreed failed')
         return jsonify({'error': str(e)}), 500
 
 def get_localized_prompt(language_code, prompt):
-    localized_templates = {
-    'hi': f"कृपया इस इनपुट का विश्लेषण करें और अपनी प्रतिक्रिया हिंदी में दें। {prompt}",
-    'bn': f"এই ইনপুটটি বিশ্লেষণ করুন এবং বাংলায় উত্তর দিন। {prompt}",
-    'gu': f"કૃપા કરીને આ ઇનપુટનું વિશ્લેષણ કરો અને ગુજરાતીમાં જવાબ આપો. {prompt}",
-    'mr': f"कृपया या इनपुटचे विश्लेषण करा आणि मराठीत उत्तर द्या. {prompt}",
-    'ta': f"இந்த உள்ளீட்டைப் பகுப்பாய்வு செய்து தமிழில் பதிலளிக்கவும். {prompt}",
-    'te': f"దయచేసి ఈ ఇన్పుట్‌ను విశ్లేషించి తెలుగులో స్పందించండి. {prompt}",
-    'kn': f"ದಯವಿಟ್ಟು ಈ ಇನ್‌ಪುಟ್ ಅನ್ನು ವಿಶ್ಲೇಷಿಸಿ ಮತ್ತು ಕನ್ನಡದಲ್ಲಿ ಪ್ರತಿಕ್ರಿಯೆ ನೀಡಿ. {prompt}",
-    'ml': f"ഈ ഇൻപുട്ട് വിശകലനം ചെയ്ത് മലയാളത്തിൽ പ്രതികരിക്കൂ. {prompt}",
-    'pa': f"ਕਿਰਪਾ ਕਰਕੇ ਇਸ ਇਨਪੁੱਟ ਦਾ ਵਿਸ਼ਲੇਸ਼ਣ ਕਰੋ ਅਤੇ ਪੰਜਾਬੀ ਵਿੱਚ ਜਵਾਬ ਦਿਓ। {prompt}",
-    'or': f"ଦୟାକରି ଏହି ଇନପୁଟ୍‌କୁ ବିଶ୍ଲେଷଣ କରନ୍ତୁ ଏବଂ ଓଡ଼ିଆରେ ପ୍ରତିକ୍ରିୟା ଦିଅ। {prompt}",
-    'en': f"Please analyze this input and respond in English. {prompt}",
-    }
-
-
-    return localized_templates.get(language_code, f"Please analyze this image and respond in English. {prompt}")
+    return localize(INPUT_PROMPT_PREFIXES, language_code, prompt)
 
 @cow_breed_bp.route('/api/new_chat', methods=['POST'])
 def new_chat():
@@ -112,8 +162,9 @@ def new_chat():
 
         session_key = f"{user_id}_{session_id}"
 
-        chat_sessions[session_key] = model.start_chat(history=[])
-        chat_sessions[session_key].send_message(SYSTEM_PROMPT, stream=False)
+        chat_sessions.put(session_key, [])
+        chat_sessions.delete(summary_key(session_key))
+        metrics.incr('priming_round_trips_saved')
 
         return jsonify({
             'session_id': session_id,
@@ -131,20 +182,26 @@ def get_chat_history():
 
         session_key = f"{user_id}_{session_id}"
 
-        if session_key not in chat_sessions:
+        chat_history = chat_sessions.get(session_key)
+        if chat_history is None:
             return jsonify({'error': 'Chat session not found'}), 404
 
-        chat = chat_sessions[session_key]
-
         history = []
-        for message in chat.history:
-            if message.role == "user" or (message.role == "model" and message.parts[0] != SYSTEM_PROMPT):
-                history.append({
-                    'role': message.role,
-                    'content': message.parts[0] if isinstance(message.parts[0], str) else "image"
-                })
+        for message in visible(chat_history):
+            part = message.parts[0]
+            # Sessions created before the system instruction change still carry the priming prompt
+            if part.text == BREED_SYSTEM_PROMPT:
+                continue
+            history.append({
+                'role': message.role,
+                'content': part.text if part.text else "image"
+            })
 
         return jsonify({'history': history})
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@cow_breed_bp.route('/api/session_stats', methods=['GET'])
+def session_stats():
+    return jsonify({**chat_sessions.stats(), 'counters': metrics.snapshot()})
@@ -0,0 +1,72 @@
+# generation.py
+"""The one path every route uses to call the model and read its answer."""
+from collections import namedtuple
+
+import metrics
+from scheduler import INTERACTIVE, scheduler
+
+# Finish reasons whose text is a usable answer; MAX_TOKENS is complete up to the output limit
+USABLE_FINISH_REASONS = ('FINISH_REASON_UNSPECIFIED', 'STOP', 'MAX_TOKENS')
+
+# text is None when the model gave no usable answer; finish_reason then says why
+# (e.g. SAFETY, or PROMPT_<block reason> when the prompt itself was blocked)
+Generation = namedtuple('Generation', 'text finish_reason usage')
+
+
+class NoAnswer(Exception):
+    """A streamed response ended without a usable answer; args[0] is the finish reason."""
+
+
+def extract(response, route):
+    """Read the answer, finish reason and token usage of a completed response."""
+    with metrics.timer('extract'):
+        block_reason = response.prompt_feedback.block_reason
+        if block_reason:
+            text, finish_reason = None, f'PROMPT_{block_reason.name}'
+        elif not response.candidates:
+            text, finish_reason = None, 'NO_CANDIDATES'
+        else:
+            candidate = response.candidates[0]
+            finish_reason = candidate.finish_reason.name
+            text = ''.join(part.text for part in candidate.content.parts if part.text)
+            if finish_reason not in USABLE_FINISH_REASONS or not text:
+                text = None
+    metrics.incr('model_finish_total', route=route, reason=finish_reason)
+    return Generation(text, finish_reason, metrics.usage_of(response, route))
+
+
+def generate(fn, contents, route, priority=INTERACTIVE):
+    """Make exactly one scheduled call to `fn` (model.generate_content or chat.send_message).
+
+    Blocked prompts and stopped candidates come back as a Generation without
+    text instead of an exception; a chat session is left without the turn.
+    """
+    # Already loaded by the time there is a model to call
+    from google.generativeai.types.generation_types import BlockedPromptException, StopCandidateException
+
+    try:
+        response = scheduler.call(fn, contents, priority=priority)
+    except BlockedPromptException as e:
+        finish_reason = f'PROMPT_{e.args[0].block_reason.name}'
+        metrics.incr('model_finish_total', route=route, reason=finish_reason)
+        return Generation(None, finish_reason, None)
+    except StopCandidateException as e:
+        candidate = e.args[0]
+        metrics.incr('model_finish_total', route=route, reason=candidate.finish_reason.name)
+        return Generation(None, candidate.finish_reason.name, None)
+    return extract(response, route)
+
+
+def stream(fn, contents, priority=INTERACTIVE):
+    """Start one scheduled streaming call; iterate it with streaming.iter_text and
+    pass it to finish() once it is exhausted."""
+    return scheduler.call(fn, contents, stream=True, priority=priority)
+
+
+def finish(response, route):
+    """extract() an exhausted streamed response; raises NoAnswer when it ended
+    without a usable answer (e.g. stopped for SAFETY midway)."""
+    generated = extract(response, route)
+    if generated.text is None:
+        raise NoAnswer(generated.finish_reason)
+    return generated
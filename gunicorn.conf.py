@@ -0,0 +1,51 @@
+# gunicorn.conf.py
+# Usage: gunicorn -c gunicorn.conf.py app:app
+#
+# Requests spend almost all of their time waiting on the Gemini API, and the
+# gRPC client releases the GIL while it waits, so each worker runs many
+# threads (gthread) and holds that many requests in flight at once.
+import multiprocessing
+import os
+import threading
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+worker_class = 'gthread'
+# In-flight requests per worker
+threads = int(os.environ.get('GUNICORN_THREADS', 64))
+# Open connections per worker, idle keep-alive ones included. Once reached the
+# worker stops accepting, and clients wait until a keep-alive connection times
+# out, so keep this well above the number of clients (bench/load.py shows it)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+backlog = int(os.environ.get('GUNICORN_BACKLOG', 2048))
+# Keep above MODEL_TIMEOUT so a slow upstream call is not killed as a hung worker
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Import the app once in the master and fork the workers from it: they share
+# its memory and start serving at once. The SDK is imported there too, but it
+# creates no client or gRPC channel until a worker's first model call, so
+# forking stays safe. Code changes then need a full restart, not a HUP.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '').lower() in ('1', 'true', 'yes')
+
+
+def warm_up():
+    # Heavy imports the app defers until first use
+    import image_pipeline
+    import model_registry
+    model_registry.genai()
+    image_pipeline.pil()
+
+
+def when_ready(server):
+    if preload_app:
+        warm_up()
+
+
+def post_worker_init(worker):
+    import admission
+    admission.set_threads(worker.cfg.threads)
+    # Without preload each worker starts accepting requests first and imports
+    # them in the background, so the first model call mostly finds them loaded
+    if not preload_app:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
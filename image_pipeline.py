@@ -0,0 +1,114 @@
+# image_pipeline.py
+import hashlib
+import io
+import os
+from collections import namedtuple
+
+import metrics
+from response_cache import create_response_cache, make_key
+
+# Longest edge sent to the model; larger photos are downscaled
+MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', 1024))
+JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 85))
+# Refuse to decode images with more pixels than this (decompression bombs)
+MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 64_000_000))
+# Image analysis cache (opt-in via IMAGE_CACHE_ENABLED); None when disabled.
+# IMAGE_CACHE_HASH=dhash keys on a perceptual hash so re-compressed copies hit too.
+IMAGE_CACHE_HASH = os.environ.get('IMAGE_CACHE_HASH', 'sha256')
+image_cache = create_response_cache('IMAGE')
+
+
+class ImageError(ValueError):
+    pass
+
+
+def pil():
+    """PIL's Image and ImageOps, imported with the first photo rather than at startup."""
+    from PIL import Image, ImageOps
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    return Image, ImageOps
+
+
+class PreparedImage(namedtuple('PreparedImage', 'mime_type data width height source_mime source_bytes')):
+    __slots__ = ()
+
+    def as_part(self):
+        return {"inline_data": {"mime_type": self.mime_type, "data": self.data}}
+
+
+def _to_rgb(image):
+    Image, _ = pil()
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+@metrics.timer('image')
+def prepare_image(image_bytes):
+    """Decode an uploaded photo once and return a JPEG ready to send to the model.
+
+    The real format is sniffed from the bytes, EXIF orientation is applied,
+    and the image is downscaled to MAX_EDGE. JPEGs that are already upright
+    and small enough are passed through untouched.
+    """
+    Image, ImageOps = pil()
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        source_format = image.format
+        source_mime = Image.MIME.get(source_format, 'application/octet-stream')
+        source_size = image.size
+        # Let libjpeg decode at a reduced scale instead of full resolution
+        if source_format == 'JPEG':
+            image.draft('RGB', (MAX_EDGE, MAX_EDGE))
+        orientation = image.getexif().get(0x0112, 1)
+        image = ImageOps.exif_transpose(image)
+    except (Image.UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise ImageError(f"Unsupported or corrupt image: {e}") from e
+
+    width, height = image.size
+    if source_format == 'JPEG' and orientation == 1 and max(source_size) <= MAX_EDGE \
+            and image.mode == 'RGB':
+        data = image_bytes
+        metrics.incr('image_passthrough_total')
+    else:
+        if max(width, height) > MAX_EDGE:
+            image.thumbnail((MAX_EDGE, MAX_EDGE), Image.LANCZOS)
+            width, height = image.size
+            metrics.incr('image_resized_total')
+        out = io.BytesIO()
+        _to_rgb(image).save(out, format='JPEG', quality=JPEG_QUALITY)
+        data = out.getvalue()
+
+    metrics.incr('image_processed_total')
+    metrics.incr('image_bytes_in_total', len(image_bytes))
+    metrics.incr('image_bytes_out_total', len(data))
+    return PreparedImage('image/jpeg', data, width, height, source_mime, len(image_bytes))
+
+
+def dhash(data, size=8):
+    """64-bit difference hash; stable across re-compression and resizing."""
+    Image, _ = pil()
+    image = Image.open(io.BytesIO(data))
+    image.draft('L', (size * 8, size * 8))
+    image = image.convert('L').resize((size + 1, size), Image.LANCZOS)
+    pixels = image.tobytes()
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+
+def image_cache_key(image, *parts):
+    """Cache key for a prepared image plus whatever else shapes the answer."""
+    if IMAGE_CACHE_HASH == 'dhash':
+        fingerprint = 'dhash:' + dhash(image.data)
+    else:
+        fingerprint = 'sha256:' + hashlib.sha256(image.data).hexdigest()
+    return make_key(fingerprint, *parts)
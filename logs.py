@@ -0,0 +1,79 @@
+# logs.py
+"""JSON logs tagged with the request ID, plus one access log line per request."""
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+
+from flask import g, has_request_context, request
+
+import metrics
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# One line per request with status, duration and per-stage timings
+ACCESS_LOG = os.environ.get('ACCESS_LOG', 'true').lower() in ('1', 'true', 'yes')
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if has_request_context() and 'request_id' in g:
+            entry['request_id'] = g.request_id
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def get_logger(name):
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+    return logger
+
+
+log = get_logger('gausampada')
+
+
+def _start_request():
+    # Reuse the ID from a proxy or client so logs can be joined across services
+    g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    g.request_start = time.perf_counter()
+
+
+def _finish_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    elapsed = time.perf_counter() - g.request_start
+    metrics.observe('http_request_seconds', elapsed, route=route, method=request.method)
+    metrics.incr('http_requests_total', route=route, method=request.method, status=response.status_code)
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    if ACCESS_LOG:
+        # Streamed bodies are still being generated; their time is up to the first byte
+        log.info('request', extra={'fields': {
+            'method': request.method,
+            'route': route,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 1),
+            'stages_ms': {stage: round(t * 1000, 1) for stage, t in g.get('stages', {}).items()},
+            'streamed': response.is_streamed,
+        }})
+    return response
+
+
+def init_app(app):
+    """Assign request IDs, time every request and write the access log."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,133 @@
+# metrics.py
+"""Process-local counters, latency histograms and gauges, exposed in the
+Prometheus text format by render(). Each gunicorn worker keeps its own values."""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+# Latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_stats_sources = []
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+
+def incr(name, amount=1, **labels):
+    key = _series(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Record `value` (seconds) in the histogram `name`."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+        index = bisect.bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+@contextmanager
+def timer(stage):
+    """Time a request stage into `stage_seconds{stage=...}`.
+
+    Inside a request the duration is also added to `g.stages`, which the
+    access log line reports per request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('stage_seconds', elapsed, stage=stage)
+        if has_request_context():
+            stages = g.setdefault('stages', {})
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+
+def register_stats(prefix, stats, **labels):
+    """Expose every numeric field of `stats()` as a gauge `<prefix>_<field>` at scrape time."""
+    _stats_sources.append((prefix, stats, labels))
+
+
+def usage_of(response, route):
+    """Token counts of a completed model response, as reported by the API."""
+    usage = response.usage_metadata
+    counts = {
+        'prompt_tokens': usage.prompt_token_count,
+        'response_tokens': usage.candidates_token_count,
+        'total_tokens': usage.total_token_count,
+        'cached_tokens': usage.cached_content_token_count,
+    }
+    incr('model_prompt_tokens_total', counts['prompt_tokens'], route=route)
+    incr('model_cached_tokens_total', counts['cached_tokens'], route=route)
+    incr('model_response_tokens_total', counts['response_tokens'], route=route)
+    return counts
+
+
+def snapshot():
+    with _lock:
+        return dict(_counters)
+
+
+def _gauges():
+    for prefix, stats, labels in _stats_sources:
+        try:
+            values = stats()
+        except Exception:
+            continue
+        for field, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield _series(f'{prefix}_{field}', labels), value
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, ([*h[0]], h[1], h[2])) for key, h in _histograms.items())
+
+    for series, value in counters:
+        declare(series.split('{', 1)[0], 'counter')
+        lines.append(f'{series} {value}')
+
+    for (name, labels), (buckets, total, count) in histograms:
+        declare(name, 'histogram')
+        labels = dict(labels)
+        cumulative = 0
+        for bound, n in zip(BUCKETS, buckets):
+            cumulative += n
+            lines.append(f'{_series(name + "_bucket", {**labels, "le": bound})} {cumulative}')
+        lines.append(f'{_series(name + "_bucket", {**labels, "le": "+Inf"})} {count}')
+        lines.append(f'{_series(name + "_sum", labels)} {total}')
+        lines.append(f'{_series(name + "_count", labels)} {count}')
+
+    for series, value in sorted(_gauges()):
+        declare(series.split('{', 1)[0], 'gauge')
+        lines.append(f'{series} {value}')
+
+    return '\n'.join(lines) + '\n'
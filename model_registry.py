@@ -0,0 +1,61 @@
+# model_registry.py
+import json
+import os
+import threading
+
+DEFAULT_MODEL = "gemini-2.0-flash-exp"
+
+_models = {}
+_lock = threading.Lock()
+_sdk = None
+_sdk_lock = threading.Lock()
+
+
+def configure(sdk):
+    # GEMINI_API is the name breed_info.py used to read the key from
+    sdk.configure(api_key=os.environ.get('GOOGLE_API_KEY') or os.environ.get('GEMINI_API'))
+
+
+def genai():
+    """The google.generativeai module, imported and configured on first use.
+
+    The SDK pulls in gRPC and protobuf and is most of the startup time, so no
+    module imports it at load time. Configuring it creates no client or
+    channel; those are made per process on the first call, which keeps a
+    gunicorn master that preloaded the SDK safe to fork.
+    """
+    global _sdk
+    if _sdk is None:
+        with _sdk_lock:
+            if _sdk is None:
+                import google.generativeai as sdk
+                configure(sdk)
+                _sdk = sdk
+    return _sdk
+
+
+def _model_key(model_name, system_instruction, generation_config):
+    config = json.dumps(generation_config, sort_keys=True) if generation_config else None
+    return model_name, system_instruction, config
+
+
+def get_model(model_name=DEFAULT_MODEL, system_instruction=None, generation_config=None):
+    """Return the GenerativeModel for this name/instruction/config, creating it once.
+
+    Models are shared by all requests in the worker. They all talk through the
+    SDK's default generative client, so the gRPC channel is set up once per
+    process rather than once per request.
+    """
+    key = _model_key(model_name, system_instruction, generation_config)
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = genai().GenerativeModel(
+                    model_name=model_name,
+                    system_instruction=system_instruction,
+                    generation_config=generation_config,
+                )
+                _models[key] = model
+    return model
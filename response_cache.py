@@ -0,0 +1,191 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+import metrics
+
+
+def normalize_prompt(prompt):
+    # "Gir cow  milk yield?" and "gir cow milk yield" share an entry
+    prompt = re.sub(r'\s+', ' ', (prompt or '').casefold()).strip()
+    return prompt.rstrip('?.!। ')
+
+
+def make_key(*parts):
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """LRU + TTL cache for generated responses with an optional SQLite tier.
+
+    Values must be JSON serializable. Concurrent misses on the same key are
+    collapsed into a single computation (single-flight); the other callers
+    wait for its result.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'evictions': 0,
+        }
+        if disk_path:
+            # A one-off connection, so none is inherited by workers forked from a preloading master
+            with closing(sqlite3.connect(disk_path, timeout=10)) as conn, conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS response_cache ('
+                    ' key TEXT PRIMARY KEY,'
+                    ' value TEXT NOT NULL,'
+                    ' expires_at REAL NOT NULL)'
+                )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _expires_at(self):
+        return time.time() + self.ttl if self.ttl else float('inf')
+
+    def _remember(self, key, value, expires_at):
+        # Caller holds self._lock
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while self.max_entries and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def _get_memory(self, key):
+        # Caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _get_disk(self, key):
+        if not self.disk_path:
+            return None
+        row = self._connect().execute(
+            'SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?',
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[1], json.loads(row[0])
+
+    def get(self, key):
+        with self._lock:
+            entry = self._get_memory(key)
+            if entry is not None:
+                self._counters['hits'] += 1
+                return entry[1]
+        entry = self._get_disk(key)
+        with self._lock:
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['disk_hits'] += 1
+            self._remember(key, entry[1], entry[0])
+        return entry[1]
+
+    def set(self, key, value):
+        expires_at = self._expires_at()
+        with self._lock:
+            self._remember(key, value, expires_at)
+        if self.disk_path:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value, ensure_ascii=False), min(expires_at, 1e18)),
+                )
+                conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (time.time(),))
+
+    def get_or_compute(self, key, compute):
+        """Return (value, hit). A `compute` result of None is returned but not cached."""
+        value = self.get(key)
+        if value is not None:
+            return value, True
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._counters['coalesced'] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, flight.value is not None
+
+        try:
+            flight.value = compute()
+            if flight.value is not None:
+                self.set(key, flight.value)
+            return flight.value, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['disk_hits'] + self._counters['misses']
+            hits = self._counters['hits'] + self._counters['disk_hits']
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'in_flight': len(self._flights),
+                'hit_ratio': hits / lookups if lookups else None,
+                **self._counters,
+            }
+
+
+def create_response_cache(prefix):
+    """Build the cache configured by <prefix>_CACHE_* variables, or None if disabled."""
+    if os.environ.get(f'{prefix}_CACHE_ENABLED', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    cache = ResponseCache(
+        max_entries=int(os.environ.get(f'{prefix}_CACHE_MAX_ENTRIES', 1024)),
+        ttl=float(os.environ.get(f'{prefix}_CACHE_TTL', 24 * 3600)),
+        disk_path=os.environ.get(f'{prefix}_CACHE_PATH') or None,
+    )
+    metrics.register_stats('response_cache', cache.stats, cache=prefix.lower())
+    return cache
@@ -0,0 +1,231 @@
+# scheduler.py
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+import metrics
+
+# Priority classes; lower runs first when calls queue for the rate limit
+INTERACTIVE = 0
+BATCH = 1
+
+# HTTP status codes (google.api_core exceptions carry them as `.code`) worth retrying
+RETRYABLE_CODES = (429, 500, 502, 503, 504)
+
+
+class UpstreamUnavailable(Exception):
+    """The model cannot be called within the deadline (rate limit, retries exhausted, circuit open)."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+def is_retryable(error):
+    return getattr(error, 'code', None) in RETRYABLE_CODES or isinstance(error, (ConnectionError, TimeoutError))
+
+
+class TokenBucket:
+    """Rate limiter sized to the API quota; waiting callers are served by priority, then FIFO."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._waiters)
+
+    def acquire(self, priority, deadline):
+        """Take a token, waiting at most until `deadline`. Returns the time waited."""
+        if not self.rate:
+            return 0.0
+        start = time.monotonic()
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    is_next = self._waiters[0] == entry
+                    if is_next and self._tokens >= 1:
+                        self._tokens -= 1
+                        return now - start
+                    remaining = deadline - now
+                    # Only the head of the queue knows when its token arrives
+                    needed = (1 - self._tokens) / self.rate if is_next else len(self._waiters) / self.rate
+                    if (needed if is_next else 0) > remaining or remaining <= 0:
+                        raise UpstreamUnavailable('Model rate limit: no capacity before the deadline',
+                                                  retry_after=needed)
+                    self._cond.wait(needed if is_next else remaining)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """Stops calling the model after repeated upstream failures, then lets one trial call through."""
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        if not self.threshold:
+            return
+        with self._lock:
+            if self.state == 'closed':
+                return
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if self.state == 'open' and remaining <= 0:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return
+            raise UpstreamUnavailable('Model temporarily unavailable (circuit open)',
+                                      retry_after=max(remaining, 1))
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or (self.threshold and self._failures >= self.threshold):
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class Scheduler:
+    """Single path for model calls: rate limit, retries with backoff, circuit breaker.
+
+    `call(fn, *args, priority=..., **kwargs)` runs `fn` once a rate-limit token
+    is available, passing `request_options={'timeout': ...}` so that no attempt
+    runs past MODEL_TIMEOUT or the call's deadline. Retryable upstream errors (429/5xx, timeouts) are retried
+    with full-jitter exponential backoff as long as the next attempt can start
+    before the call's deadline; otherwise UpstreamUnavailable is raised so
+    handlers can answer 503 with Retry-After instead of a bare 500.
+    """
+
+    def __init__(self, rate_per_minute=0, burst=None, max_retries=3, backoff_base=0.5,
+                 backoff_max=8.0, breaker_threshold=5, breaker_cooldown=30, deadlines=None, timeout=60.0):
+        self.limiter = TokenBucket(rate_per_minute, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadlines = deadlines or {INTERACTIVE: 30.0, BATCH: 300.0}
+        # Longest a single attempt may take, in seconds
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._counters = {
+            'calls': 0,
+            'retries': 0,
+            'failures': 0,
+            'rejected': 0,
+            'wait_seconds_total': 0.0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            rate_per_minute=float(os.environ.get('MODEL_RATE_PER_MINUTE', 0)),
+            burst=float(os.environ.get('MODEL_RATE_BURST', 0)) or None,
+            max_retries=int(os.environ.get('MODEL_MAX_RETRIES', 3)),
+            breaker_threshold=int(os.environ.get('MODEL_BREAKER_THRESHOLD', 5)),
+            breaker_cooldown=float(os.environ.get('MODEL_BREAKER_COOLDOWN', 30)),
+            deadlines={
+                INTERACTIVE: float(os.environ.get('MODEL_INTERACTIVE_DEADLINE', 30)),
+                BATCH: float(os.environ.get('MODEL_BATCH_DEADLINE', 300)),
+            },
+            timeout=float(os.environ.get('MODEL_TIMEOUT', 60)),
+        )
+
+    def set_rate(self, rate_per_minute, burst=None):
+        self.limiter = TokenBucket(rate_per_minute, burst)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def call(self, fn, *args, priority=INTERACTIVE, deadline=None, **kwargs):
+        if deadline is None:
+            deadline = time.monotonic() + self.deadlines.get(priority, self.deadlines[INTERACTIVE])
+        attempt = 0
+        while True:
+            try:
+                self._count('wait_seconds_total', self.limiter.acquire(priority, deadline))
+                self.breaker.before_call()
+            except UpstreamUnavailable:
+                self._count('rejected')
+                raise
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count('rejected')
+                raise UpstreamUnavailable('Model call deadline passed before the attempt could start')
+            options = kwargs.get('request_options') or {}
+            options = {**options, 'timeout': min(options.get('timeout', self.timeout), remaining)}
+
+            self._count('calls')
+            try:
+                with metrics.timer('model'):
+                    result = fn(*args, **{**kwargs, 'request_options': options})
+            except Exception as e:
+                if not is_retryable(e):
+                    # The upstream answered; the request itself was bad
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                self._count('failures')
+                attempt += 1
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    self._count('rejected')
+                    raise UpstreamUnavailable(f'Model call failed after {attempt} attempt(s): {e}',
+                                              retry_after=delay) from e
+                self._count('retries')
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            'queue_depth': self.limiter.queue_depth(),
+            'rate_per_minute': self.limiter.rate * 60,
+            'circuit': self.breaker.state,
+            'circuit_open': int(self.breaker.state != 'closed'),
+            **counters,
+        }
+
+
+scheduler = Scheduler.from_env()
+metrics.register_stats('scheduler', scheduler.stats)
+
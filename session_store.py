@@ -0,0 +1,410 @@
+# session_store.py
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+
+def _content_size(content):
+    # Serialized size of a protos.Content, images included
+    try:
+        return type(content).pb(content).ByteSize()
+    except Exception:
+        return len(str(content))
+
+
+def history_size(history):
+    return sum(_content_size(content) for content in history)
+
+
+def serialize_history(history):
+    # Length-prefixed protobuf messages; images stay binary instead of base64
+    from google.generativeai import protos
+    chunks = []
+    for content in history:
+        data = protos.Content.serialize(content)
+        chunks.append(struct.pack('>I', len(data)))
+        chunks.append(data)
+    return b''.join(chunks)
+
+
+def deserialize_history(blob):
+    from google.generativeai import protos
+    history = []
+    view = memoryview(blob)
+    offset = 0
+    while offset < len(view):
+        (length,) = struct.unpack_from('>I', view, offset)
+        offset += 4
+        history.append(protos.Content.deserialize(bytes(view[offset:offset + length])))
+        offset += length
+    return history
+
+
+class SessionStore:
+    """Base interface for chat session storage.
+
+    Sessions are keyed by "<user_id>_<session_id>" and hold the chat history
+    (a list of `protos.Content`), so a ChatSession can be rebuilt from it on
+    every request with `model.start_chat(history=...)`.
+
+    - max_sessions: least recently used sessions are evicted past this count
+    - idle_ttl: sessions untouched for this many seconds are dropped
+    - max_turns: user/model turn pairs kept per session (oldest dropped first)
+    - max_bytes: serialized history size kept per session
+    """
+
+    backend = None
+
+    def __init__(self, max_sessions=1000, idle_ttl=1800, max_turns=20,
+                 max_bytes=4 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self._counters_lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'evicted_lru': 0,
+            'evicted_idle': 0,
+            'trimmed_turns': 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self._counters[name] += amount
+
+    def _trim(self, history):
+        dropped = 0
+
+        if self.max_turns and len(history) > self.max_turns * 2:
+            cut = len(history) - self.max_turns * 2
+            history = history[cut:]
+            dropped += cut // 2
+
+        size = history_size(history)
+        # Always keep the latest turn, even if it alone exceeds the cap
+        while self.max_bytes and size > self.max_bytes and len(history) > 2:
+            size -= _content_size(history[0]) + _content_size(history[1])
+            history = history[2:]
+            dropped += 1
+
+        if dropped:
+            self._count('trimmed_turns', dropped)
+        return history, size
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, history):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return {
+            'backend': self.backend,
+            'max_sessions': self.max_sessions,
+            **counters,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """Per-process store. Fast, but sessions are not shared between workers.
+
+    - max_total_bytes: least recently used sessions are evicted once all of
+      them together are larger than this
+    """
+
+    backend = 'memory'
+
+    def __init__(self, max_total_bytes=0, **limits):
+        super().__init__(**limits)
+        self.max_total_bytes = max_total_bytes
+        self._sessions = OrderedDict()  # key -> (last_access, size, history)
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._sessions.pop(key)
+        self._total_bytes -= size
+
+    def _expire(self, now):
+        if not self.idle_ttl:
+            return
+        # Entries are ordered by last access, so expired ones sit at the front
+        while self._sessions:
+            key, (last_access, _, _) = next(iter(self._sessions.items()))
+            if now - last_access < self.idle_ttl:
+                break
+            self._remove(key)
+            self._count('evicted_idle')
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(key)
+            if entry is None:
+                self._count('misses')
+                return None
+            _, size, history = entry
+            self._sessions[key] = (now, size, history)
+            self._sessions.move_to_end(key)
+        self._count('hits')
+        return list(history)
+
+    def put(self, key, history):
+        history, size = self._trim(list(history))
+        now = time.monotonic()
+        with self._lock:
+            if key in self._sessions:
+                self._remove(key)
+            self._sessions[key] = (now, size, history)
+            self._total_bytes += size
+            self._expire(now)
+            while self.max_sessions and len(self._sessions) > self.max_sessions:
+                self._remove(next(iter(self._sessions)))
+                self._count('evicted_lru')
+            # The session just stored is the most recent and is always kept
+            while self.max_total_bytes and self._total_bytes > self.max_total_bytes and len(self._sessions) > 1:
+                self._remove(next(iter(self._sessions)))
+                self._count('evicted_lru')
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._sessions:
+                self._remove(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._sessions.get(key)
+            return entry is not None and (
+                not self.idle_ttl or time.monotonic() - entry[0] < self.idle_ttl)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            sessions, total_bytes = len(self._sessions), self._total_bytes
+        return {
+            **super().stats(),
+            'sessions': sessions,
+            'bytes': total_bytes,
+            'max_total_bytes': self.max_total_bytes,
+            'occupancy': sessions / self.max_sessions if self.max_sessions else None,
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store backed by a SQLite file, shared by every worker on the host."""
+
+    backend = 'sqlite'
+
+    def __init__(self, path='chat_sessions.db', **limits):
+        super().__init__(**limits)
+        self.path = path
+        self._local = threading.local()
+        # A one-off connection, so none is inherited by workers forked from a preloading master
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn, conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS chat_sessions ('
+                ' key TEXT PRIMARY KEY,'
+                ' history BLOB NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' last_access REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS chat_sessions_last_access'
+                ' ON chat_sessions (last_access)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT history, last_access FROM chat_sessions WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and self.idle_ttl and now - row[1] >= self.idle_ttl:
+                conn.execute('DELETE FROM chat_sessions WHERE key = ?', (key,))
+                self._count('evicted_idle')
+                row = None
+            if row is None:
+                self._count('misses')
+                return None
+            conn.execute('UPDATE chat_sessions SET last_access = ? WHERE key = ?', (now, key))
+        self._count('hits')
+        return deserialize_history(row[0])
+
+    def put(self, key, history):
+        history, size = self._trim(list(history))
+        blob = serialize_history(history)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO chat_sessions (key, history, size, last_access) VALUES (?, ?, ?, ?)'
+                ' ON CONFLICT(key) DO UPDATE SET history = excluded.history,'
+                ' size = excluded.size, last_access = excluded.last_access',
+                (key, blob, size, now),
+            )
+            if self.idle_ttl:
+                expired = conn.execute(
+                    'DELETE FROM chat_sessions WHERE last_access < ?', (now - self.idle_ttl,)
+                ).rowcount
+                if expired > 0:
+                    self._count('evicted_idle', expired)
+            if self.max_sessions:
+                evicted = conn.execute(
+                    'DELETE FROM chat_sessions WHERE key IN ('
+                    ' SELECT key FROM chat_sessions ORDER BY last_access DESC'
+                    ' LIMIT -1 OFFSET ?)',
+                    (self.max_sessions,),
+                ).rowcount
+                if evicted > 0:
+                    self._count('evicted_lru', evicted)
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM chat_sessions WHERE key = ?', (key,))
+
+    def __len__(self):
+        (count,) = self._connect().execute('SELECT COUNT(*) FROM chat_sessions').fetchone()
+        return count
+
+    def stats(self):
+        sessions, total_bytes = self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM chat_sessions'
+        ).fetchone()
+        return {
+            **super().stats(),
+            'sessions': sessions,
+            'bytes': total_bytes,
+            'occupancy': sessions / self.max_sessions if self.max_sessions else None,
+        }
+
+
+class RedisSessionStore(SessionStore):
+    """Store backed by Redis (or any client speaking the same commands).
+
+    Histories live under "<prefix><key>" with the idle TTL as key expiry, and a
+    sorted set of last-access times drives LRU eviction and the session count.
+    Pass `client` to use an existing connection or a local stand-in.
+    """
+
+    backend = 'redis'
+
+    def __init__(self, url='redis://localhost:6379/0', client=None, prefix='chat_session:', **limits):
+        super().__init__(**limits)
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.index_key = prefix + '__index__'
+
+    def _expiry(self):
+        return int(self.idle_ttl) if self.idle_ttl else None
+
+    def get(self, key):
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.get(self.prefix + key)
+        if self.idle_ttl:
+            pipe.expire(self.prefix + key, self._expiry())
+        blob = pipe.execute()[0]
+        if blob is None:
+            self.client.zrem(self.index_key, key)
+            self._count('misses')
+            return None
+        self.client.zadd(self.index_key, {key: now})
+        self._count('hits')
+        return deserialize_history(blob)
+
+    def put(self, key, history):
+        history, size = self._trim(list(history))
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, serialize_history(history), ex=self._expiry())
+        pipe.zadd(self.index_key, {key: now})
+        if self.idle_ttl:
+            pipe.zremrangebyscore(self.index_key, '-inf', now - self.idle_ttl)
+        pipe.zcard(self.index_key)
+        results = pipe.execute()
+        if self.idle_ttl and results[2]:
+            self._count('evicted_idle', results[2])
+
+        overflow = results[-1] - self.max_sessions if self.max_sessions else 0
+        if overflow > 0:
+            oldest = self.client.zrange(self.index_key, 0, overflow - 1)
+            if oldest:
+                pipe = self.client.pipeline()
+                pipe.zrem(self.index_key, *oldest)
+                pipe.delete(*[self.prefix + (k.decode() if isinstance(k, bytes) else k)
+                              for k in oldest])
+                pipe.execute()
+                self._count('evicted_lru', len(oldest))
+
+    def delete(self, key):
+        pipe = self.client.pipeline()
+        pipe.delete(self.prefix + key)
+        pipe.zrem(self.index_key, key)
+        pipe.execute()
+
+    def __contains__(self, key):
+        return bool(self.client.exists(self.prefix + key))
+
+    def __len__(self):
+        return self.client.zcard(self.index_key)
+
+    def stats(self):
+        sessions = len(self)
+        return {
+            **super().stats(),
+            'sessions': sessions,
+            'occupancy': sessions / self.max_sessions if self.max_sessions else None,
+        }
+
+
+def create_session_store():
+    limits = dict(
+        max_sessions=int(os.environ.get('SESSION_MAX_SESSIONS', 1000)),
+        idle_ttl=float(os.environ.get('SESSION_IDLE_TTL', 1800)),
+        max_turns=int(os.environ.get('SESSION_MAX_TURNS', 20)),
+        max_bytes=int(os.environ.get('SESSION_MAX_BYTES', 4 * 1024 * 1024)),
+    )
+    backend = os.environ.get('SESSION_BACKEND', 'memory')
+    if backend == 'sqlite':
+        return SQLiteSessionStore(path=os.environ.get('SESSION_SQLITE_PATH', 'chat_sessions.db'), **limits)
+    if backend == 'redis':
+        return RedisSessionStore(url=os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0'), **limits)
+    if backend != 'memory':
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    return MemorySessionStore(
+        max_total_bytes=int(os.environ.get('SESSION_MAX_TOTAL_BYTES', 256 * 1024 * 1024)), **limits)
@@ -0,0 +1,88 @@
+# streaming.py
+import json
+
+from flask import Response, request, stream_with_context
+
+from logs import log
+
+NDJSON = 'application/x-ndjson'
+SSE = 'text/event-stream'
+
+
+def stream_requested(data):
+    # Form and query-string values arrive as strings
+    value = data.get('stream', request.args.get('stream'))
+    return value is True or str(value).lower() in ('1', 'true')
+
+
+def iter_text(response):
+    """Yield the text of each chunk of a `stream=True` model response."""
+    for chunk in response:
+        if not chunk.candidates:
+            continue
+        text = ''.join(part.text for part in chunk.candidates[0].content.parts if part.text)
+        if text:
+            yield text
+
+
+def _negotiate():
+    return request.accept_mimetypes.best_match([NDJSON, SSE]) or NDJSON
+
+
+def _response(fmt, body):
+    return Response(
+        stream_with_context(body),
+        mimetype=fmt,
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def _encode(fmt, payload, event=None):
+    body = json.dumps(payload, ensure_ascii=False)
+    if fmt == SSE:
+        prefix = f"event: {event}\n" if event else ""
+        return f"{prefix}data: {body}\n\n"
+    return body + "\n"
+
+
+def stream_text(chunks, on_complete=None, done=None, error_message='An error occurred during text generation'):
+    """Stream text pieces to the client as server-sent events or NDJSON.
+
+    SSE is used when the client accepts `text/event-stream`, NDJSON otherwise.
+    Every piece is sent as {"delta": ...}; the stream ends with {"done": true}
+    plus the `done` fields (a dict, or a callable evaluated at the end), or
+    {"error": ...} if generation fails midway.
+    `on_complete(full_text)` runs after the last piece, before the final event.
+    """
+    fmt = _negotiate()
+
+    def generate():
+        pieces = []
+        try:
+            for text in chunks:
+                pieces.append(text)
+                yield _encode(fmt, {'delta': text})
+            if on_complete is not None:
+                on_complete(''.join(pieces))
+            extra = done() if callable(done) else done
+        except Exception:
+            log.exception('stream failed')
+            yield _encode(fmt, {'error': error_message}, event='error')
+            return
+        yield _encode(fmt, {'done': True, **(extra or {})}, event='done')
+
+    return _response(fmt, generate())
+
+
+def stream_json(payloads):
+    """Stream each dict from `payloads` as an NDJSON line or server-sent event.
+
+    A payload with "done" is sent as the SSE `done` event.
+    """
+    fmt = _negotiate()
+
+    def generate():
+        for payload in payloads:
+            yield _encode(fmt, payload, event='done' if payload.get('done') else None)
+
+    return _response(fmt, generate())
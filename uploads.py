@@ -0,0 +1,82 @@
+# uploads.py
+import base64
+import os
+
+from flask import abort, request
+
+import metrics
+from image_pipeline import ImageError
+
+# Bodies larger than this are rejected with 413 before they are read
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 24 * 1024 * 1024))
+# Batch item key holding the bytes of an uploaded file; never taken from a JSON body
+UPLOADED_IMAGE = '_uploaded_image'
+
+
+def reject_oversize_request():
+    """before_request hook: refuse bodies over the limit from Content-Length alone."""
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+        abort(413)
+
+
+def read_image_request(json_field, file_field='image'):
+    """Return (fields, image_bytes) from the current request.
+
+    Three body formats are accepted:
+    - multipart/form-data: the image in the `file_field` file, other fields as form values
+    - application/octet-stream or image/*: the raw image as the body, other fields in the query string
+    - JSON (the original API): the image base64 encoded in `json_field`
+
+    image_bytes is None when no image was sent.
+    """
+    mimetype = request.mimetype
+    with metrics.timer('parse'):
+        if mimetype == 'multipart/form-data':
+            fields = request.form.to_dict()
+            upload = request.files.get(file_field)
+            return fields, (upload.read() or None) if upload else None
+
+        if mimetype == 'application/octet-stream' or mimetype.startswith('image/'):
+            return request.args.to_dict(), request.get_data(cache=False) or None
+
+        fields = request.get_json()
+    return fields, decode_base64_image(fields.get(json_field))
+
+
+def read_image_batch_request(json_field, file_field='image'):
+    """Return (fields, items) for a batch of images.
+
+    - JSON: {"items": [{"<json_field>": ..., "prompt": ..., "language": ..., "id": ...}, ...]},
+      the image base64 encoded in `json_field` (or `file_field`)
+    - multipart/form-data: every `file_field` file is an item, with the filename as its id,
+      its bytes under UPLOADED_IMAGE and the form values as shared options
+
+    Images are left encoded in JSON items so they can be decoded in parallel
+    with decode_base64_image().
+    """
+    with metrics.timer('parse'):
+        if request.mimetype == 'multipart/form-data':
+            items = [{'id': upload.filename, UPLOADED_IMAGE: upload.read()}
+                     for upload in request.files.getlist(file_field)]
+            return request.form.to_dict(), items
+
+        fields = request.get_json()
+    if not isinstance(fields, dict):
+        raise ValueError("The request body must be a JSON object with 'items'")
+    items = fields.get('items') or []
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError("'items' must be a list of objects")
+    items = [{key: value for key, value in item.items() if key != UPLOADED_IMAGE} for item in items]
+    return fields, items
+
+
+def decode_base64_image(encoded):
+    if not encoded:
+        return None
+    try:
+        with metrics.timer('decode'):
+            # Rejects stray characters instead of silently dropping them
+            return base64.b64decode(encoded, validate=True)
+    # binascii.Error for bad padding or characters, TypeError for a non-string value
+    except (TypeError, ValueError) as e:
+        raise ImageError(f"Invalid base64 image: {e}") from e